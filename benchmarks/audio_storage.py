@@ -0,0 +1,82 @@
+#
+# benchmarks/audio_storage.py
+#
+
+"""
+Compares keeping the preview clips as one file per song in the
+assets folder with keeping them as blobs in the database
+
+Measures how long it takes to get the first chunk of a clip back
+and how much disk space all of the clips take up
+
+Usage:
+    python benchmarks/audio_storage.py [number of clips] [clip size in KB]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# the database is created in the current directory when it is
+# imported so move into an empty one first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from musicGame.database import db_engine, store_audio, read_audio, AUDIO_BLOBS_SUPPORTED, AUDIO_CHUNK_SIZE
+
+
+def disk_usage(path):
+    # the space actually taken up on disk, not just the file size
+    return os.stat(path).st_blocks * 512
+
+
+def database_usage(path):
+    # the database is in wal mode, so move everything written into the
+    # main file first and count whatever is still left beside it
+    db_engine.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    return sum(disk_usage(file_path) for file_path in (path, f"{path}-wal", f"{path}-shm") if os.path.exists(file_path))
+
+
+def main(clip_count=200, clip_size=300):
+    if not AUDIO_BLOBS_SUPPORTED:
+        print("Storing audio in the database needs python 3.11")
+        return
+
+    os.makedirs("assets")
+    song_ids = [f"song{number}" for number in range(clip_count)]
+
+    for song_id in song_ids:
+        with open(f"assets/{song_id}.mp3", "wb") as clip_file:
+            clip_file.write(os.urandom(clip_size * 1024))
+
+    for song_id in song_ids:
+        store_audio(song_id, f"assets/{song_id}.mp3")
+
+    # First byte latency
+    start_time = time.perf_counter()
+    for song_id in song_ids:
+        with open(f"assets/{song_id}.mp3", "rb") as clip_file:
+            clip_file.read(AUDIO_CHUNK_SIZE)
+    file_latency = (time.perf_counter() - start_time) / clip_count
+
+    start_time = time.perf_counter()
+    for song_id in song_ids:
+        chunks = read_audio(song_id)
+        next(chunks)
+        chunks.close()
+    database_latency = (time.perf_counter() - start_time) / clip_count
+
+    # Disk footprint
+    file_footprint = sum(disk_usage(f"assets/{song_id}.mp3") for song_id in song_ids)
+    database_footprint = database_usage("main.db")
+
+    print(f"{clip_count} clips of {clip_size} KB")
+    print(f"{'':<10} {'first byte':>12} {'disk used':>12}")
+    print(f"{'files':<10} {file_latency * 1000000:>9.1f} us {file_footprint / 1024 / 1024:>9.2f} MB")
+    print(f"{'database':<10} {database_latency * 1000000:>9.1f} us {database_footprint / 1024 / 1024:>9.2f} MB")
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:3]])
@@ -0,0 +1,101 @@
+#
+# benchmarks/blank_songname.py
+#
+
+"""
+Checks that blank_songname gives exactly the same 'to guess' names as
+it used to and times it on a 5,000 song playlist and on very long
+titles, against the old version and against reading the blanked name
+that each song now works out when it's made
+
+Usage:
+    python benchmarks/blank_songname.py [playlist size] [long title length]
+"""
+
+import os
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.audio import Song
+from musicGame.game import blank_songname
+from format_songname import make_titles
+
+
+def original_blank_songname(song_name):
+    # blank_songname before it was sped up, the results have to match
+    word_list = song_name.split(" ")
+    song_guess = []
+
+    for word in word_list:
+        word_guess = ""
+        had_first = False
+
+        for char in word:
+            if char.isalpha():
+                if not had_first:
+                    word_guess += char.upper()
+                    had_first = True
+                else:
+                    word_guess += "_ "
+            else:
+                word_guess += char
+
+        song_guess.append(word_guess)
+
+    return " ".join(song_guess)
+
+
+def timed(function, names):
+    start_time = time.perf_counter()
+    results = function(names)
+    return results, time.perf_counter() - start_time
+
+
+def main(playlist_size=5000, long_title_length=10000):
+    songs = [Song(f"song{number}", title, ["Artist"]) for number, title in enumerate(make_titles(playlist_size))]
+    playlist = [song.name for song in songs]
+
+    long_titles = [
+        "a" * long_title_length,
+        " ".join(["word"] * (long_title_length // 5)),
+        "ß9'é-x " * (long_title_length // 7)
+    ]
+
+    print(f"{'':<28} {'original':>10} {'new':>10} {'on song':>10}")
+
+    for name, names in ((f"{playlist_size} song playlist", playlist), (f"3 titles of {long_title_length} chars", long_titles)):
+        expected, original_time = timed(lambda names: [original_blank_songname(name) for name in names], names)
+        blanked, new_time = timed(lambda names: [blank_songname(name) for name in names], names)
+
+        if blanked != expected:
+            print(f"{name}: blanked differently to before")
+            sys.exit(1)
+
+        if names is playlist:
+            precomputed, precomputed_time = timed(lambda songs: [song.blank_name for song in songs], songs)
+
+            if precomputed != expected:
+                print(f"{name}: song.blank_name is different to before")
+                sys.exit(1)
+
+            precomputed = f"{precomputed_time * 1000:>7.2f} ms"
+        else:
+            precomputed = f"{'':>10}"
+
+        print(f"{name:<28} {original_time * 1000:>7.2f} ms {new_time * 1000:>7.2f} ms {precomputed}")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:3]])
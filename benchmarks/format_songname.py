@@ -0,0 +1,170 @@
+#
+# benchmarks/format_songname.py
+#
+
+"""
+Checks that format_songname gives exactly the same names as it used
+to for a corpus of made up song titles (including the awkward ones)
+and times how many titles a second it can format
+
+Usage:
+    python benchmarks/format_songname.py [number of titles]
+"""
+
+import os
+import random
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.game import format_songname
+
+
+def original_format_songname(song_name):
+    # format_songname before it was sped up, the results have to match
+    song_name = song_name.lower()
+
+    num_brackets = song_name.count("(")
+
+    for bracket_pairs in range(num_brackets):
+        bracket_start = song_name.find("(")
+        bracket_end = song_name.find(")")
+
+        if bracket_start != -1 and bracket_end != -1:
+            song_name = song_name.replace(song_name[bracket_start:bracket_end + 1], "")
+
+    remix_start = song_name.find(" - ")
+    remix_end = song_name.find("remix")
+
+    if remix_start != -1 and remix_end != -1:
+        song_name = song_name.replace(song_name[remix_start:remix_end + 5], "")
+
+    feat_start = song_name.find("feat.")
+
+    if feat_start != -1:
+        song_name = song_name.replace(song_name[feat_start: ], "")
+
+    terms = [
+        ("radio edit", ""),
+        (" - ", " "),
+        (",", " "),
+        ("remastered", ""),
+        ("[remix]", ""),
+        ("film version", ""),
+        (".", ""),
+        ("spider-man: into the spider-verse", ""),
+        ("from \"watership down\"", "")
+    ]
+
+    for term in terms:
+        song_name = song_name.replace(term[0], term[1])
+
+    return " ".join(song_name.split())
+
+
+WORDS = ["Love", "Night", "Mr.", "Brightside", "Don't", "Stop", "Me", "Now", "Viva", "La", "Vida", "Sandstorm", "Harder", "Better", "Café", "Señorita", "U.S.A.", "Radio", "Remix", "Edit", "One", "Two", "Bright", "Eyes", "Sunflower", "Spider-Man", "Here,", "There", "Rock'n'Roll", "99"]
+
+EXTRAS = [
+    "",
+    "",
+    "",
+    " (feat. Artist Name)",
+    " (with Someone)",
+    " - Radio Edit",
+    " - Artist Remix",
+    " - Remastered 2011",
+    " - 2009 Remastered Version",
+    " [Remix]",
+    " feat. Another Artist",
+    " (Film Version)",
+    " - Spider-Man: Into the Spider-Verse",
+    " (From \"Watership Down\")",
+    " (Live) (Acoustic)",
+    " (Part 1",
+    " Part 2)",
+    ") Backwards (",
+    " ((Nested) Brackets)",
+    " - Remix - Remix",
+    " remix - After",
+    "  Double  Spaces ",
+    " -radio edit- x",
+    " a.- b",
+    ", Comma, Separated"
+]
+
+
+# how many titles are in the playlist that is loaded twice
+PLAYLIST_SIZE = 5000
+
+
+def make_titles(title_count):
+    # the same titles every time so runs can be compared
+    generator = random.Random(0)
+    titles = []
+
+    for number in range(title_count):
+        words = generator.sample(WORDS, generator.randint(1, 5))
+        extras = "".join(generator.choice(EXTRAS) for extra in range(generator.randint(1, 2)))
+        titles.append(" ".join(words) + extras)
+
+    return titles
+
+
+def timed(function, titles):
+    start_time = time.perf_counter()
+    results = function(titles)
+    return results, time.perf_counter() - start_time
+
+
+def main(title_count=100000):
+    titles = make_titles(title_count)
+
+    expected, original_time = timed(lambda titles: [original_format_songname(title) for title in titles], titles)
+
+    uncached, uncached_time = timed(lambda titles: [format_songname.__wrapped__(title) for title in titles], titles)
+
+    format_songname.cache_clear()
+    cold, cold_time = timed(lambda titles: [format_songname(title) for title in titles], titles)
+
+    # a playlist being loaded again, which is when the cache helps
+    playlist = titles[:PLAYLIST_SIZE]
+    format_songname.cache_clear()
+    [format_songname(title) for title in playlist]
+    warm, warm_time = timed(lambda titles: [format_songname(title) for title in titles], playlist)
+
+    mismatches = [(title, expected_name, name) for title, expected_name, name in zip(titles, expected, uncached) if expected_name != name]
+
+    for title, expected_name, name in mismatches[:10]:
+        print(f"{title!r}: expected {expected_name!r}, got {name!r}")
+
+    if mismatches or cold != expected or warm != expected[:PLAYLIST_SIZE]:
+        print(f"{len(mismatches)} of {title_count} titles are formatted differently")
+        sys.exit(1)
+
+    print(f"{title_count} titles ({len(set(titles))} different), all formatted the same as before")
+    print(f"{'':<16} {'titles/s':>12}")
+
+    runs = [
+        ("original", title_count, original_time),
+        ("uncached", title_count, uncached_time),
+        ("cached (cold)", title_count, cold_time),
+        ("cached (warm)", len(playlist), warm_time)
+    ]
+
+    for name, count, run_time in runs:
+        print(f"{name:<16} {count / run_time:>12,.0f}")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:2]])
@@ -0,0 +1,157 @@
+#
+# benchmarks/game_simulation.py
+#
+
+"""
+Plays scripted games with GameEngine on a simulated clock, so no time
+is spent waiting, against a made up playlist
+
+First a few players whose scores are known are checked (always right,
+right on the second go, never right...) and then lots of games with
+players that are sometimes right, sometimes make typos and sometimes
+don't know are timed
+
+Usage:
+    python benchmarks/game_simulation.py [number of games] [playlist size]
+"""
+
+import os
+import random
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.audio import Song
+from musicGame.game import GameEngine, SimulatedClock, ATTEMPT_SCORES
+from format_songname import make_titles
+from guess_matching import add_typos
+
+
+# how long the simulated player takes to make each guess
+THINKING_TIME = 4
+
+
+def make_playlist(song_count):
+    # every third song has no clip, like songs spotify has no preview for
+    return [Song(f"song{number}", title, ["Artist"], None if number % 3 == 0 else f"assets/song{number}.mp3") for number, title in enumerate(make_titles(song_count))]
+
+
+def play_game(songs, player, generator=None):
+    """
+    Plays one game, player(song, attempt, generator) gives each guess
+
+    Returns:
+        the engine once the game is over and how long it took
+        in simulated seconds
+    """
+
+    clock = SimulatedClock()
+    engine = GameEngine(songs, clock)
+
+    def game_changed(event, song, clip_duriation):
+        if event == "guess":
+            guess = player(song, engine.attempts + 1, generator)
+            clock.call_later(THINKING_TIME, lambda: engine.guess(guess))
+
+    engine.subscribe(game_changed)
+    engine.start()
+    clock.run()
+
+    return engine, clock.time
+
+
+def always_right(song, attempt, generator):
+    return song.name
+
+
+def right_second_time(song, attempt, generator):
+    return song.name if attempt == 2 else "not it"
+
+
+def never_right(song, attempt, generator):
+    return "no idea"
+
+
+def shouts_in_capitals(song, attempt, generator):
+    return f"  {song.name.upper()} "
+
+
+def sometimes_right(song, attempt, generator):
+    chance = generator.random()
+
+    if chance < 0.8:
+        return song.name
+
+    if chance < 0.9:
+        typos = generator.randint(0, song.guess_matcher().max_distance + 1)
+        return add_typos(generator, song.name, typos) if typos > 0 else song.name
+
+    return "no idea"
+
+
+def engine_pause(song):
+    return GameEngine([]).pause_duriation(song)
+
+
+def check_known_players(songs):
+    # the scores these players get can be worked out beforehand
+    pauses = sum(engine_pause(song) for song in songs)
+    last_pause = engine_pause(songs[0])
+
+    expected = [
+        (always_right, ATTEMPT_SCORES[0] * len(songs), len(songs), 0, True, len(songs) * THINKING_TIME + pauses),
+        (right_second_time, ATTEMPT_SCORES[1] * len(songs), len(songs), len(songs), True, len(songs) * THINKING_TIME * 2 + pauses * 2),
+        (never_right, 0, 0, len(ATTEMPT_SCORES), False, len(ATTEMPT_SCORES) * (THINKING_TIME + last_pause)),
+        (shouts_in_capitals, ATTEMPT_SCORES[0] * len(songs), len(songs), 0, True, len(songs) * THINKING_TIME + pauses)
+    ]
+
+    for player, score, correct, incorrect, completed, game_time in expected:
+        engine, took = play_game(songs, player)
+        result = (engine.total_score, engine.total_correct, engine.total_incorrect, engine.completed, took)
+
+        if result != (score, correct, incorrect, completed, game_time):
+            print(f"{player.__name__}: expected {(score, correct, incorrect, completed, game_time)}, got {result}")
+            sys.exit(1)
+
+    print(f"{len(expected)} scripted players got the expected scores")
+
+
+def main(game_count=5000, song_count=40):
+    songs = make_playlist(song_count)
+
+    # work out the matchers first so only the games are timed
+    for song in songs:
+        song.guess_matcher()
+
+    check_known_players(songs)
+
+    generator = random.Random(0)
+    guesses = 0
+    scores = []
+
+    start_time = time.perf_counter()
+
+    for game in range(game_count):
+        engine, took = play_game(songs, sometimes_right, generator)
+        guesses += engine.total_correct + engine.total_incorrect
+        scores.append(engine.total_score)
+
+    run_time = time.perf_counter() - start_time
+
+    print(f"{game_count} games of a {song_count} song playlist, average score {sum(scores) / len(scores):.1f}")
+    print(f"{game_count / run_time:,.0f} games a second, {guesses / run_time:,.0f} guesses a second")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:3]])
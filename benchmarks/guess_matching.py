@@ -0,0 +1,123 @@
+#
+# benchmarks/guess_matching.py
+#
+
+"""
+Times how long checking one guess takes with GuessMatcher for song
+names from a few characters up to very long ones, for right guesses,
+guesses with typos and guesses that are nowhere near. The distances
+are also checked against a plain dynamic programming edit distance
+
+Usage:
+    python benchmarks/guess_matching.py [guesses per case]
+"""
+
+import os
+import random
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.game import GuessMatcher
+
+
+WORDS = ["viva", "la", "vida", "sandstorm", "harder", "better", "faster", "stronger", "mr", "brightside", "bohemian", "rhapsody", "dont", "stop", "me", "now"]
+
+
+def edit_distance(first, second):
+    # the simple way, to check GuessMatcher against
+    previous_row = list(range(len(second) + 1))
+
+    for first_position, first_char in enumerate(first, 1):
+        row = [first_position]
+
+        for second_position, second_char in enumerate(second, 1):
+            row.append(min(previous_row[second_position] + 1, row[second_position - 1] + 1, previous_row[second_position - 1] + (first_char != second_char)))
+
+        previous_row = row
+
+    return previous_row[-1]
+
+
+def make_name(generator, length):
+    words = []
+
+    while len(" ".join(words)) < length:
+        words.append(generator.choice(WORDS))
+
+    return " ".join(words)[:length].strip()
+
+
+def add_typos(generator, name, typos):
+    name = list(name)
+
+    for typo in range(typos):
+        position = generator.randrange(len(name))
+        change = generator.choice(("swap", "add", "remove"))
+
+        if change == "swap":
+            name[position] = generator.choice("abcdefghijklmnopqrstuvwxyz")
+        elif change == "add":
+            name.insert(position, generator.choice("abcdefghijklmnopqrstuvwxyz"))
+        elif len(name) > 1:
+            del name[position]
+
+    return "".join(name)
+
+
+def time_guesses(matcher, guesses):
+    start_time = time.perf_counter()
+
+    for guess in guesses:
+        matcher.distance(guess)
+
+    return (time.perf_counter() - start_time) / len(guesses)
+
+
+def main(guess_count=200):
+    generator = random.Random(0)
+
+    print(f"{'name length':>11} {'typos allowed':>14} {'right':>10} {'typos':>10} {'far off':>10} {'same length':>12} {'simple':>10}")
+
+    for length in (10, 30, 100, 300, 1000):
+        name = make_name(generator, length)
+        matcher = GuessMatcher(name)
+
+        typo_guesses = [add_typos(generator, name, generator.randint(1, max(matcher.max_distance, 1))) for guess in range(guess_count)]
+        far_guesses = [make_name(generator, generator.randint(1, length * 2)) for guess in range(guess_count)]
+        same_length_guesses = [make_name(generator, len(name)) for guess in range(guess_count)]
+
+        for guess in typo_guesses[:20] + far_guesses[:20] + same_length_guesses[:20]:
+            distance = edit_distance(matcher.answer, " ".join(guess.split()))
+            expected = distance if distance <= matcher.max_distance else None
+
+            if matcher.distance(guess) != expected:
+                print(f"Wrong distance for {guess!r}")
+                sys.exit(1)
+
+        right_time = time_guesses(matcher, [name.upper()] * guess_count)
+        typo_time = time_guesses(matcher, typo_guesses)
+        far_time = time_guesses(matcher, far_guesses)
+        same_length_time = time_guesses(matcher, same_length_guesses)
+
+        simple_start_time = time.perf_counter()
+        for guess in same_length_guesses[:10]:
+            edit_distance(matcher.answer, guess)
+        simple_time = (time.perf_counter() - simple_start_time) / 10
+
+        print(f"{len(name):>11} {matcher.max_distance:>14} {right_time * 1000000:>7.1f} us {typo_time * 1000000:>7.1f} us {far_time * 1000000:>7.1f} us {same_length_time * 1000000:>9.1f} us {simple_time * 1000000:>7.0f} us")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:2]])
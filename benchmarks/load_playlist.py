@@ -0,0 +1,111 @@
+#
+# benchmarks/load_playlist.py
+#
+
+"""
+Times load_playlist against the local stand in spotify server for
+a few playlist sizes, first with nothing saved (cold) and then again
+with the database and clips from the first run (warm)
+
+Each run is a fresh python process in its own folder, just like the
+game starting up, and the server counts the requests and bytes sent
+
+With --sample only that many songs are picked at random, like the
+sample_size config option
+
+Usage:
+    python benchmarks/load_playlist.py [--sizes 40 500 5000] [--latency 0.02] [--sample 10] ...
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import StandInServer, write_config
+
+
+def run_load(sample_size=None):
+    # ran in the child process, inside the folder for this playlist
+    sys.path.insert(0, REPOSITORY_FOLDER)
+
+    start_time = time.perf_counter()
+
+    from musicGame.game import load_playlist
+
+    song_list = load_playlist(sample_size=sample_size)
+    playable_time = time.perf_counter()
+
+    # wait for the rest of the clips and anything else still going
+    for thread in threading.enumerate():
+        if thread.name in ("Downloader", "PlaylistRefresh"):
+            thread.join()
+
+    finished_time = time.perf_counter()
+
+    print(json.dumps({
+        "songs": len(song_list),
+        "playable": playable_time - start_time,
+        "finished": finished_time - start_time,
+        "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }))
+
+
+def run_child(folder, sample_size=None):
+    sample_arguments = [] if sample_size is None else ["--sample", str(sample_size)]
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"] + sample_arguments, cwd=folder, capture_output=True, text=True)
+
+    if child.returncode != 0:
+        print(child.stdout)
+        print(child.stderr)
+        raise RuntimeError("load_playlist failed")
+
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load_playlist against a stand in spotify")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40, 500, 5000])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--clip-size", type=int, default=100 * 1024)
+    parser.add_argument("--sample", type=int, default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child:
+        run_load(arguments.sample)
+        return
+
+    print(f"{'tracks':>7} {'run':>5} {'playable':>9} {'finished':>9} {'requests':>9} {'clips':>6} {'api sent':>9} {'sent':>9} {'peak rss':>9}")
+
+    for size in arguments.sizes:
+        server = StandInServer(size, arguments.page_size, arguments.latency, arguments.throttle_rate, arguments.error_rate, arguments.clip_size).start()
+        folder = tempfile.mkdtemp(prefix=f"musicgame{size}-")
+
+        write_config(folder, server, asset_budget=100000)
+
+        for run in ("cold", "warm"):
+            server.reset_stats()
+            result = run_child(folder, arguments.sample)
+            stats = server.stats
+
+            print(f"{size:>7} {run:>5} {result['playable']:>8.2f}s {result['finished']:>8.2f}s {stats['requests']:>9} {stats['clips']:>6} {stats['api_bytes'] / 1024:>7.0f}KB {stats['bytes'] / 1024 / 1024:>7.2f}MB {result['peak_memory'] / 1024:>7.0f}MB")
+
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
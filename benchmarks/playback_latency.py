@@ -0,0 +1,137 @@
+#
+# benchmarks/playback_latency.py
+#
+
+"""
+Measures how long the player's backend takes from being given a clip
+to playing it, the same load, set_volume and play calls the player
+makes, for the mp3 as it is and for the decoded clip (warmed into the
+page cache first, like the player does)
+
+With GStreamer the time goes on until the clip has reached the playing
+state, so its first samples have been decoded and handed to the sound
+card. The other backends start a process to play the clip, so only the
+time for that to start can be measured
+
+Also shows how long decoding each clip ahead of time takes and how
+much space the decoded clips use. Needs ffmpeg, the clips are made up
+unless a folder of mp3s (like assets) is given. The clips are played
+silently
+
+Usage:
+    python benchmarks/playback_latency.py [--clips 20] [--folder assets]
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+# the stand in moves into an empty folder, --folder is from here
+start_folder = os.getcwd()
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.game import DECODED_CLIP_LENGTH
+from musicGame.audio import PlaybackWorker, GstreamerBackend, choose_backend
+from musicGame.networking import decode_clip, decoded_location, DECODED_FOLDER
+
+
+def make_clips(ffmpeg, clip_count):
+    # 30 second clips, the same length as spotify's previews
+    paths = []
+
+    for number in range(clip_count):
+        path = f"clip{number}.mp3"
+        subprocess.run([ffmpeg, "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency={220 + number * 10}:duration=30", "-ac", "2", "-b:a", "128k", path], check=True)
+        paths.append(path)
+
+    return paths
+
+
+def wait_until_playing(backend, clip):
+    if isinstance(backend, GstreamerBackend):
+        clip.get_state(backend.Gst.CLOCK_TIME_NONE)
+
+
+def time_to_play(backend, location, worker=None):
+    start_time = time.perf_counter()
+
+    if worker is not None:
+        worker.warm_clip(location)
+
+    clip = backend.load(location)
+    backend.set_volume(clip, 0)
+    backend.play(clip)
+    wait_until_playing(backend, clip)
+
+    play_time = time.perf_counter() - start_time
+    backend.stop(clip)
+
+    return play_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clip load to play latency through the player's backend")
+    parser.add_argument("--clips", type=int, default=20)
+    parser.add_argument("--folder", help="a folder of mp3s to use instead of made up clips")
+    arguments = parser.parse_args()
+
+    ffmpeg = shutil.which("ffmpeg")
+
+    if ffmpeg is None:
+        print("This benchmark needs ffmpeg")
+        server.stop()
+        return
+
+    if arguments.folder is not None:
+        folder = os.path.join(start_folder, arguments.folder)
+        paths = sorted(glob.glob(os.path.join(folder, "*.mp3")))[:arguments.clips]
+    else:
+        paths = make_clips(ffmpeg, arguments.clips)
+
+    if len(paths) == 0:
+        print("No clips to use")
+        server.stop()
+        return
+
+    os.makedirs(DECODED_FOLDER)
+
+    start_time = time.perf_counter()
+    for number, path in enumerate(paths):
+        decode_clip(path, f"clip{number}", DECODED_CLIP_LENGTH)
+    decode_time = (time.perf_counter() - start_time) / len(paths)
+
+    decoded_paths = [decoded_location(f"clip{number}") for number in range(len(paths))]
+
+    # only used for warming the decoded clips, it isn't started
+    backend = choose_backend()
+    worker = PlaybackWorker(backend)
+
+    mp3_latency = sorted(time_to_play(backend, path) for path in paths)
+    decoded_latency = sorted(time_to_play(backend, path, worker) for path in decoded_paths)
+
+    mp3_size = sum(os.path.getsize(path) for path in paths) / len(paths)
+    decoded_size = sum(os.path.getsize(path) for path in decoded_paths) / len(paths)
+
+    print(f"{len(paths)} clips, decoded to {DECODED_CLIP_LENGTH} seconds in {decode_time * 1000:.0f} ms each, played with {type(backend).__name__}")
+    print(f"{'':<8} {'median':>12} {'worst':>12} {'size':>10}")
+    print(f"{'mp3':<8} {mp3_latency[len(paths) // 2] * 1000:>9.2f} ms {mp3_latency[-1] * 1000:>9.2f} ms {mp3_size / 1024:>7.0f} KB")
+    print(f"{'decoded':<8} {decoded_latency[len(paths) // 2] * 1000:>9.2f} ms {decoded_latency[-1] * 1000:>9.2f} ms {decoded_size / 1024:>7.0f} KB")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
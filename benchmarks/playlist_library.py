@@ -0,0 +1,84 @@
+#
+# benchmarks/playlist_library.py
+#
+
+"""
+Times choosing playlists from a PlaylistLibrary against the stand in
+spotify server, the first time each one is chosen, switching back to
+one that is still in memory and going back to one that was dropped
+from memory so has to be loaded from the database
+
+Every stand in playlist has the same tracks, so only the first one
+chosen should download any clips
+
+Usage:
+    python benchmarks/playlist_library.py [latency]
+"""
+
+import os
+import sys
+import threading
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from musicGame.game import PlaylistLibrary
+
+
+PLAYLISTS = {
+    "first": "First Playlist",
+    "second": "Second Playlist",
+    "third": "Third Playlist"
+}
+
+
+def choose(library, playlist_id):
+    server.reset_stats()
+    start_time = time.perf_counter()
+
+    song_list = library.get(playlist_id)
+    choose_time = time.perf_counter() - start_time
+
+    # the rest of the clips finish downloading before the next choice
+    for thread in threading.enumerate():
+        if thread.name == "Downloader":
+            thread.join()
+
+    return song_list, choose_time, dict(server.stats)
+
+
+def main(latency=0.02):
+    server.latency = latency
+
+    # only room for two, so the first is dropped when the third is chosen
+    library = PlaylistLibrary(PLAYLISTS, cache_size=2)
+
+    steps = [
+        ("first", "first time"),
+        ("second", "first time"),
+        ("first", "in memory"),
+        ("third", "first time"),
+        ("second", "dropped"),
+        ("third", "in memory")
+    ]
+
+    print(f"{'playlist':>9} {'':<11} {'songs':>6} {'time':>9} {'requests':>9} {'clips':>6}")
+
+    for playlist_id, expected in steps:
+        song_list, choose_time, stats = choose(library, playlist_id)
+
+        print(f"{playlist_id:>9} {expected:<11} {len(song_list):>6} {choose_time * 1000:>6.1f} ms {stats['requests']:>9} {stats['clips']:>6}")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[float(argument) for argument in sys.argv[1:2]])
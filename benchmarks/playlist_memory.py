@@ -0,0 +1,117 @@
+#
+# benchmarks/playlist_memory.py
+#
+
+"""
+Measures how much memory is used once a playlist has been fetched,
+and the most used while it was being fetched and converted, for 500
+and 50,000 track playlists from the stand in spotify server
+
+The memory for each song is then compared with how much the Song
+class used to take (a dictionary for its attributes and an event each)
+
+Each size is measured in a fresh python process
+
+Usage:
+    python benchmarks/playlist_memory.py [--sizes 500 50000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import StandInServer, write_config
+
+
+class OriginalSong:
+    # audio.Song before it used slots, without the methods
+
+    def __init__(self, id = None, name=None, artists=None, location=None, url=None):
+        from musicGame.game import format_songname, blank_songname
+
+        self.id = id
+        self.raw_name = name
+        self.name = format_songname(name)
+        self.blank_name = blank_songname(self.name)
+        self.matcher = None
+        self.artists = " & ".join(artists)
+        self.location = location
+        self.url = url
+
+        self.ready = threading.Event()
+        self.ready.set()
+
+
+def measure(playlist_id):
+    # ran in the child process, inside its own folder
+    sys.path.insert(0, REPOSITORY_FOLDER)
+
+    from musicGame.audio import Song
+    from musicGame.game import fetch_playlist
+
+    tracemalloc.start()
+
+    song_list, snapshot_id = fetch_playlist(playlist_id)
+    fetched_size, fetch_peak = tracemalloc.get_traced_memory()
+
+    # the same songs made again both ways, so only the songs are counted
+    # and not everything else used while fetching
+    sizes = {}
+
+    for name, song_class in (("song_size", Song), ("original_size", OriginalSong)):
+        before_size = tracemalloc.get_traced_memory()[0]
+        songs = [song_class(song.id, song.raw_name, song.artists.split(" & "), song.location, song.url) for song in song_list]
+        sizes[name] = tracemalloc.get_traced_memory()[0] - before_size
+
+    print(json.dumps({
+        "songs": len(song_list),
+        "size": fetched_size,
+        "peak": fetch_peak,
+        "song_size": sizes["song_size"],
+        "original_size": sizes["original_size"]
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory used by a fetched playlist")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 50000])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child is not None:
+        measure(arguments.child)
+        return
+
+    print(f"{'tracks':>7} {'fetched':>10} {'peak':>10} {'per song':>10} {'before':>10}")
+
+    for size in arguments.sizes:
+        server = StandInServer(size).start()
+        folder = tempfile.mkdtemp(prefix=f"musicgame{size}-")
+        write_config(folder, server)
+
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "benchmark"], cwd=folder, capture_output=True, text=True)
+
+        if child.returncode != 0:
+            print(child.stdout)
+            print(child.stderr)
+            raise RuntimeError("fetching the playlist failed")
+
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+
+        print(f"{size:>7} {result['size'] / 1024 / 1024:>7.2f} MB {result['peak'] / 1024 / 1024:>7.2f} MB {result['song_size'] / result['songs']:>8.0f} B {result['original_size'] / result['songs']:>8.0f} B")
+
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
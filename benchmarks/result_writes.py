@@ -0,0 +1,92 @@
+#
+# benchmarks/result_writes.py
+#
+
+"""
+Times how many game results a second save_result can write, from the
+main thread and from a new thread for each result (like the gui's
+Timer threads), against how it used to save them: a new sessionmaker
+and scoped session for every result on an engine without a connection
+pool or any pragmas
+
+Usage:
+    python benchmarks/result_writes.py [number of results]
+"""
+
+import os
+import sys
+import threading
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+from spotify_server import use_stand_in
+
+# importing game logs in to spotify so give it the stand in
+server = use_stand_in()
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from musicGame.database import Base, Result
+from musicGame.game import save_result, get_results
+
+
+# the database the original way of saving writes to
+original_engine = create_engine("sqlite:///original.db")
+Base.metadata.create_all(original_engine)
+
+
+def original_save_result(user_id, total_score, correct_guesses, incorrect_guesses):
+    # save_result before it used the shared session
+    session_factory = sessionmaker(bind=original_engine)
+    Session = scoped_session(session_factory)
+    db_session = Session()
+
+    new_result = Result(user_id=user_id, score=total_score, questions_correct=correct_guesses, questions_incorrect=incorrect_guesses)
+    db_session.add(new_result)
+    db_session.commit()
+
+
+def on_main_thread(save, result_count):
+    for number in range(result_count):
+        save(1, number, number % 40, number % 7)
+
+
+def on_new_threads(save, result_count):
+    # one thread after another, like the end of each game
+    for number in range(result_count):
+        thread = threading.Thread(target=save, args=(2, number, number % 40, number % 7))
+        thread.start()
+        thread.join()
+
+
+def timed(run, save, result_count):
+    start_time = time.perf_counter()
+    run(save, result_count)
+    return result_count / (time.perf_counter() - start_time)
+
+
+def main(result_count=1000):
+    print(f"{'':<12} {'original':>12} {'save_result':>12}")
+
+    for name, run in (("main thread", on_main_thread), ("new threads", on_new_threads)):
+        original_rate = timed(run, original_save_result, result_count)
+        new_rate = timed(run, save_result, result_count)
+
+        print(f"{name:<12} {original_rate:>10,.0f}/s {new_rate:>10,.0f}/s")
+
+    saved = len(get_results(1)) + len(get_results(2))
+
+    if saved != result_count * 2:
+        print(f"Expected {result_count * 2} results to be saved, found {saved}")
+        sys.exit(1)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:2]])
@@ -0,0 +1,373 @@
+#
+# benchmarks/spotify_server.py
+#
+
+"""
+A local stand in for the parts of the spotify api that the game uses
+so that Spotify, Downloader and load_playlist can be ran without any
+credentials or the real api
+
+Serves:
+    POST /api/token/                    -> a client credentials token
+    GET  /v1/playlists/{id}/            -> the playlist with its first page of tracks
+    GET  /v1/playlists/{id}/tracks      -> a page of tracks using offset and limit
+
+Both playlist endpoints understand the fields filter.
+    GET  /clips/{track id}.mp3          -> a preview clip (supports Range)
+
+To use it, point the game at it in config.json:
+
+    {
+        "client_id": "anything",
+        "client_secret": "anything",
+        "api_url": "http://127.0.0.1:<port>/v1",
+        "accounts_url": "http://127.0.0.1:<port>/api"
+    }
+
+Usage:
+    python benchmarks/spotify_server.py [--port 8080] [--tracks 40] ...
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+# a tiny id3v2.4 tag followed by made up audio data
+CLIP_HEADER = b"ID3\x04\x00\x00\x00\x00\x00\x00"
+
+
+def parse_fields(fields):
+    """
+    Turns a spotify fields filter like "a,b(c,d)" into
+    {"a": None, "b": {"c": None, "d": None}}
+    """
+
+    def parse(position):
+        selected = {}
+        name = ""
+
+        while position < len(fields):
+            character = fields[position]
+
+            if character == "(":
+                selected[name], position = parse(position + 1)
+                name = ""
+            elif character == ")":
+                break
+            elif character == ",":
+                if name != "":
+                    selected[name] = None
+                name = ""
+            else:
+                name += character
+
+            position += 1
+
+        if name != "":
+            selected[name] = None
+
+        return selected, position
+
+    return parse(0)[0]
+
+
+def apply_fields(data, selected):
+    # keeps only the selected fields, lists have it applied to each item
+    if selected is None:
+        return data
+
+    if isinstance(data, list):
+        return [apply_fields(item, selected) for item in data]
+
+    if isinstance(data, dict):
+        return {name: apply_fields(data[name], selected[name]) for name in selected if name in data}
+
+    return data
+
+
+def write_config(folder, server, **options):
+    # points the game in folder at server, options are added to the config
+    config = {
+        "client_id": "benchmark",
+        "client_secret": "benchmark",
+        "api_url": f"{server.url}/v1",
+        "accounts_url": f"{server.url}/api"
+    }
+    config.update(options)
+
+    with open(os.path.join(folder, "config.json"), "w") as config_file:
+        config_file.write(json.dumps(config))
+
+
+# the server started by use_stand_in
+stand_in = None
+
+
+def use_stand_in():
+    """
+    Starts a stand in server and moves into an empty folder with a
+    config pointing at it, for benchmarks that import game as it logs
+    in to spotify when it's imported. Only the first call does this,
+    the rest return the same server
+    """
+
+    global stand_in
+
+    if stand_in is None:
+        stand_in = StandInServer().start()
+        os.chdir(tempfile.mkdtemp())
+        write_config(os.getcwd(), stand_in)
+
+    return stand_in
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Args:
+        track_count: How many tracks are in every playlist (Default: 40)
+        page_size: The most tracks sent in one page (Default: 100)
+        latency: Seconds added before every response (Default: 0)
+        throttle_rate: Fraction of api requests answered with a 429 (Default: 0)
+        error_rate: Fraction of requests answered with a 500 (Default: 0)
+        clip_size: Size of each preview clip in bytes (Default: 100KB)
+        port: Port to listen on, 0 picks a free one (Default: 0)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, track_count=40, page_size=100, latency=0, throttle_rate=0, error_rate=0, clip_size=100 * 1024, port=0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+
+        self.track_count = track_count
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.clip = CLIP_HEADER + os.urandom(clip_size - len(CLIP_HEADER))
+        self.snapshot_id = "snapshot1"
+
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        server_thread = threading.Thread(target=self.serve_forever, name="StandInServer")
+        server_thread.daemon = True
+        server_thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # the game closing its connections when it exits isn't a problem
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {
+                "requests": 0,
+                "token": 0,
+                "playlist": 0,
+                "pages": 0,
+                "clips": 0,
+                "throttled": 0,
+                "errors": 0,
+                "bytes": 0,
+                "api_bytes": 0
+            }
+
+    def count(self, name, sent_bytes=0):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats[name] += 1
+            self.stats["bytes"] += sent_bytes
+
+            if name in ("playlist", "pages"):
+                self.stats["api_bytes"] += sent_bytes
+
+    def track(self, position):
+        # shaped like a real playlist item, including the parts
+        # the game doesn't use
+        track_id = f"track{position:06d}"
+
+        return {
+            "added_at": "2019-01-01T00:00:00Z",
+            "is_local": False,
+            "track": {
+                "id": track_id,
+                "name": f"Song Number {position} (feat. Someone Else) - Radio Edit",
+                "preview_url": f"{self.url}/clips/{track_id}.mp3",
+                "duration_ms": 200000,
+                "explicit": False,
+                "popularity": 50,
+                "available_markets": ["GB", "US", "DE", "FR", "ES", "IT", "NL", "SE"],
+                "external_ids": {"isrc": f"GB{position:010d}"},
+                "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+                "album": {
+                    "id": f"album{position:06d}",
+                    "name": f"Album {position}",
+                    "artists": [
+                        {"id": f"artist{position % 300}", "name": f"Artist {position % 300}"},
+                        {"id": f"artist{position % 7}", "name": f"Artist {position % 7}"}
+                    ],
+                    "images": [
+                        {"height": size, "width": size, "url": f"https://i.scdn.co/image/{track_id}{size}"} for size in (640, 300, 64)
+                    ]
+                }
+            }
+        }
+
+    def page(self, playlist_id, offset, limit):
+        limit = min(limit, self.page_size)
+        end = min(offset + limit, self.track_count)
+        next_url = None
+
+        if end < self.track_count:
+            next_url = f"{self.url}/v1/playlists/{playlist_id}/tracks?offset={end}&limit={limit}"
+
+        return {
+            "items": [self.track(position) for position in range(offset, end)],
+            "total": self.track_count,
+            "limit": limit,
+            "offset": offset,
+            "next": next_url
+        }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type="application/json", headers={}):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def send_json(self, status, data, headers={}):
+        return self.send_body(status, json.dumps(data).encode(), headers=headers)
+
+    def injected_failure(self, api_request):
+        # returns True if this request was answered with an error
+        server = self.server
+
+        if api_request and random.random() < server.throttle_rate:
+            sent_bytes = self.send_json(429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, {"Retry-After": "1"})
+            server.count("throttled", sent_bytes)
+            return True
+
+        if random.random() < server.error_rate:
+            sent_bytes = self.send_json(500, {"error": {"status": 500, "message": "Server error"}})
+            server.count("errors", sent_bytes)
+            return True
+
+        return False
+
+    def do_POST(self):
+        server = self.server
+        time.sleep(server.latency)
+
+        # read the form body so the connection can be reused
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if urlparse(self.path).path.rstrip("/") != "/api/token":
+            server.count("errors", self.send_json(404, {"error": "not found"}))
+        elif not self.injected_failure(False):
+            server.count("token", self.send_json(200, {"access_token": "stand-in-token", "token_type": "Bearer", "expires_in": 3600}))
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path.strip("/").split("/")
+
+        if path[0] == "clips":
+            if not self.injected_failure(False):
+                server.count("clips", self.send_clip())
+        elif path[:2] == ["v1", "playlists"] and len(path) in (3, 4):
+            if self.headers.get("Authorization") != "Bearer stand-in-token":
+                server.count("errors", self.send_json(401, {"error": {"status": 401, "message": "Invalid access token"}}))
+            elif not self.injected_failure(True):
+                playlist_id = path[2]
+                offset = int(query.get("offset", ["0"])[0])
+                limit = int(query.get("limit", [str(server.page_size)])[0])
+
+                if len(path) == 4:
+                    response = server.page(playlist_id, offset, limit)
+                else:
+                    response = {
+                        "id": playlist_id,
+                        "name": "Stand In Playlist",
+                        "snapshot_id": server.snapshot_id,
+                        "tracks": server.page(playlist_id, 0, server.page_size)
+                    }
+
+                if "fields" in query:
+                    response = apply_fields(response, parse_fields(query["fields"][0]))
+
+                server.count("pages" if len(path) == 4 else "playlist", self.send_json(200, response))
+        else:
+            server.count("errors", self.send_json(404, {"error": "not found"}))
+
+    def send_clip(self):
+        clip = self.server.clip
+        clip_range = self.headers.get("Range")
+
+        if clip_range is not None:
+            start = int(clip_range.split("=")[1].split("-")[0])
+
+            if start >= len(clip):
+                return self.send_body(416, b"", "audio/mpeg")
+
+            return self.send_body(206, clip[start:], "audio/mpeg", {"Content-Range": f"bytes {start}-{len(clip) - 1}/{len(clip)}"})
+
+        return self.send_body(200, clip, "audio/mpeg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand in for the spotify api")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--clip-size", type=int, default=100 * 1024)
+    arguments = parser.parse_args()
+
+    server = StandInServer(arguments.tracks, arguments.page_size, arguments.latency, arguments.throttle_rate, arguments.error_rate, arguments.clip_size, arguments.port)
+    print(f"Stand in spotify api running at {server.url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
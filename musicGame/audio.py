@@ -3,109 +3,531 @@
 # by William Neild
 #
 
+import atexit
+import mmap
 import os
+import queue
+import shutil
+import subprocess
 import sys
+import tempfile
 import time
 import threading
 
-from musicGame.game import format_songname
+from collections import OrderedDict
+
+from musicGame.database import read_audio, mark_played, AUDIO_LOCATION_PREFIX
+from musicGame.game import format_songname, blank_songname, GuessMatcher
+from musicGame.networking import decoded_location
+
+
+# How many decoded clips are kept mapped so their pages stay in the
+# page cache, the backends open the file themselves so the mapping
+# only warms the cache for them
+WARMED_CLIPS = 4
+
+# How many clips can be loaded ready to play at once
+PRELOADED_CLIPS = 2
+
+# How many clips stored in the database are kept extracted to files so
+# playing them again doesn't write them out again, more than the
+# preloaded clips and the one playing so those are never deleted
+EXTRACTED_CLIPS = 8
+
+
+
+class PlayerState:
+    # the states that the player can be in, it goes from idle to
+    # loading to playing and then stopping before going back to idle
+    idle = "idle"
+    loading = "loading"
+    playing = "playing"
+    stopping = "stopping"
 
 
 
 class Player:
     """
-    The main class which handles audio playing and some conversion
+    The main class which handles audio playing
+
+    All of the playing is done by one PlaybackWorker which is started
+    when the player is created and kept running, the player just sends
+    it commands
     """
 
+    def __init__(self, backend=None):
+        self.worker = PlaybackWorker(backend)
+        self.worker.start()
+
+    @property
+    def state(self):
+        return self.worker.state
+
+    @property
+    def song(self):
+        # the song being loaded or played, if there is one
+        return self.worker.song
+
+    def is_playing(self):
+        return self.worker.state != PlayerState.idle
+
+    def subscribe(self, listener):
+        """
+        Calls listener(state, song) every time the player changes state,
+        this is called from the player's thread
+        """
+
+        self.worker.listeners.append(listener)
+
     def play(self, song, duriation):
         """
         function that is initially called to play some audio
 
-        first it checks whether a song file is availible, then 
-        it checks whether a "Player" thread is already running
-        and if it isn't, creates a new one to start playing the
-        specified audio clip
+        first it checks whether a song file is availible, then tells
+        the worker to play the specified audio clip, anything it is
+        already playing is cancelled
         """
 
         if song.location is not None:
-            for thread in threading.enumerate():
-                if thread.name == "Player":
-                    running = True
-                else:
-                    running = False
-            
-            if not running:
-                play_thread = threading.Thread(target=self.play_check, name="Player", args=(song, duriation))
-                play_thread.daemon = True
-                play_thread.start()
-
-    def play_check(self, song, duriation):
-        if sys.platform == "darwin":
-            self.play_mac(song, duriation)
+            self.worker.commands.put(("play", song, duriation))
+
+    def stop(self):
+        self.worker.commands.put(("stop", ))
+
+    def preload(self, song):
+        # opens the clip ready to play so it starts straight away
+        if song.location is not None:
+            self.worker.commands.put(("preload", song))
+
+    def set_volume(self, volume):
+        # volume is between 0 and 1
+        self.worker.commands.put(("volume", volume))
+
+
+
+class PlaybackWorker(threading.Thread):
+    """
+    A thread that lives for as long as the game does and plays the
+    clips it's told to over its command queue
+
+    Commands:
+        ("play", song, duriation) -> stops whatever is playing and plays song
+        ("stop", )                -> stops whatever is playing
+        ("preload", song)         -> opens song ready to be played, only the
+                                     last PRELOADED_CLIPS songs are kept open
+        ("volume", volume)        -> sets the volume from 0 to 1
+
+    A clip is stopped as soon as its duriation is up or another
+    command to play or stop arrives
+    """
+
+    def __init__(self, backend=None):
+        super().__init__(name="Player")
+        self.daemon = True
+
+        self.commands = queue.Queue()
+        self.listeners = []
+
+        self.state = PlayerState.idle
+        self.song = None
+
+        self.backend = backend
+        self.volume = 1.0
+
+        self.clip = None
+        self.stop_time = None
+        self.preloaded = OrderedDict()
+        self.warmed_clips = OrderedDict()
+        self.extracted_clips = OrderedDict()
+        self.extract_folder = None
+
+    def run(self):
+        # the backend is made on this thread as some of them have to
+        # be used from the thread that created them
+        if self.backend is None:
+            self.backend = choose_backend()
+
+        while True:
+            timeout = None
+
+            if self.clip is not None:
+                timeout = max(self.stop_time - time.monotonic(), 0)
+
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                self.stop_clip()
+                continue
+
+            try:
+                self.run_command(command)
+            except Exception as error:
+                # keep going so the next song can still be played
+                print(f"Player error: {error}")
+                self.stop_clip()
+
+    def run_command(self, command):
+        name = command[0]
+
+        if name == "play":
+            song, duriation = command[1:]
+            self.stop_clip()
+            self.play_clip(song, duriation)
+        elif name == "stop":
+            self.stop_clip()
+        elif name == "preload":
+            self.preload_clip(command[1])
+        elif name == "volume":
+            self.volume = command[1]
+
+            if self.clip is not None:
+                self.backend.set_volume(self.clip, self.volume)
+
+    def set_state(self, state, song):
+        self.state = state
+        self.song = song
+
+        for listener in self.listeners:
+            try:
+                listener(state, song)
+            except Exception as error:
+                print(f"Player listener error: {error}")
+
+    def play_clip(self, song, duriation):
+        self.set_state(PlayerState.loading, song)
+
+        if song.location in self.preloaded:
+            clip = self.preloaded.pop(song.location)
         else:
-            self.play_other(song, duriation)
+            clip = self.backend.load(self.clip_location(song))
 
-    def play_mac(self, song, duriation):
-        import subprocess
+        self.clip = clip
+        self.stop_time = time.monotonic() + duriation
 
-        # use mac specific afplay command
+        self.backend.set_volume(self.clip, self.volume)
+        self.backend.play(self.clip)
+
+        self.set_state(PlayerState.playing, song)
+
+        # the database write is done on another thread so it doesn't
+        # hold up the clip, and can't stop it playing if it fails
+        record_thread = threading.Thread(target=self.record_play, name="PlayRecorder", args=(song.id, ))
+        record_thread.daemon = True
+        record_thread.start()
+
+    def record_play(self, song_id):
+        # keeps the clip from being deleted when the assets folder is full
         try:
-            mac_process = subprocess.Popen([ "afplay", song.location ])
-            mac_process.wait(duriation)
-        except subprocess.TimeoutExpired as error:
-            print("Song stopped")
+            mark_played(song_id)
         except Exception as error:
-            print(f"Unknown Error: {error}")
-        finally:
-            mac_process.terminate()
-            mac_process.kill()
+            print(f"Couldn't record that {song_id} was played: {error}")
 
-    def play_other(self, song, duriation):
-        import multiprocessing
-        import playsound as ps
+    def stop_clip(self):
+        if self.clip is not None:
+            self.set_state(PlayerState.stopping, self.song)
+
+            try:
+                self.backend.stop(self.clip)
+            finally:
+                self.clip = None
+
+        if self.state != PlayerState.idle:
+            self.set_state(PlayerState.idle, None)
+
+    def preload_clip(self, song):
+        if song.location in self.preloaded:
+            self.preloaded.move_to_end(song.location)
+            return
+
+        self.preloaded[song.location] = self.backend.load(self.clip_location(song))
 
-        # placed here as only windoes seems affected by this bug
-        self.convert_id3v23(song.location)
+        # close the clips that were preloaded longest ago
+        while len(self.preloaded) > PRELOADED_CLIPS:
+            self.backend.stop(self.preloaded.popitem(last=False)[1])
+
+    def clip_location(self, song):
+        # returns the file to play
+        decoded = decoded_location(song.id)
+
+        # a decoded clip doesn't need decoding before it can start
+        if os.path.exists(decoded):
+            self.warm_clip(decoded)
+            return decoded
+
+        if song.location.startswith(AUDIO_LOCATION_PREFIX):
+            return self.extract_audio(song)
+
+        return song.location
+
+    def warm_clip(self, location):
+        """
+        Has all of a decoded clip read into the page cache, so when the
+        backend opens the file its first samples don't wait on the disk.
+        The clip is mapped to ask for this, nothing reads from the
+        mapping itself
+        """
+
+        if location in self.warmed_clips:
+            self.warmed_clips.move_to_end(location)
+            return
 
-        # use playsound inside of a subprocess as you are unable to control it via
-        # the playsound module
-        audio_process = multiprocessing.Process(target=ps.playsound, args=(song.location, ))
-        
         try:
-            audio_process.start()
-            audio_process.join(duriation)
-            print("Song Stopped")
-        except Exception as e:
-            print(e)
+            with open(location, "rb") as clip_file:
+                mapped = mmap.mmap(clip_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            print(f"Couldn't warm {location}: {error}")
+            return
 
-        # ensure that the process is no longer running
-        if audio_process.is_alive():
-            audio_process.terminate()
-            audio_process.join()
-    
-    def convert_id3v23(self, file):
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_WILLNEED)
+        else:
+            # windows can't be asked to, so read a byte from each page
+            for offset in range(0, len(mapped), mmap.PAGESIZE):
+                mapped[offset]
+
+        self.warmed_clips[location] = mapped
+
+        while len(self.warmed_clips) > WARMED_CLIPS:
+            self.warmed_clips.popitem(last=False)[1].close()
+
+    def extract_audio(self, song):
         """
-        By default, files downloaded from spotify use the id3v2.4 tag
-        format which doesn't work with playsound on windows (unsure
-        about Linux)
+        The players can only play files so audio stored in the database
+        is streamed out of it a chunk at a time into a file, the last
+        few are kept so a clip is only written out once while it's
+        being preloaded and played
         """
-        
-        from mutagen.id3 import ID3
 
-        audio_file = ID3(file)
-        audio_file.save(v2_version=3)
+        location = self.extracted_clips.get(song.id)
+
+        if location is not None and os.path.exists(location):
+            self.extracted_clips.move_to_end(song.id)
+            return location
+
+        if self.extract_folder is None:
+            self.extract_folder = tempfile.mkdtemp(prefix="musicgame-")
+            atexit.register(shutil.rmtree, self.extract_folder, True)
+
+        location = os.path.join(self.extract_folder, f"{song.id}.mp3")
+
+        with open(location, "wb") as audio_file:
+            for chunk in read_audio(song.id):
+                audio_file.write(chunk)
 
+        self.extracted_clips[song.id] = location
+
+        while len(self.extracted_clips) > EXTRACTED_CLIPS:
+            old_location = self.extracted_clips.popitem(last=False)[1]
+
+            if os.path.exists(old_location):
+                os.remove(old_location)
+
+        return location
+
+
+
+def choose_backend():
+    """
+    Picks the way audio is played on this platform, these do the same
+    as the playsound module does but can be stopped whenever we want
+    """
+
+    if sys.platform == "darwin":
+        return AfplayBackend()
+
+    if sys.platform == "win32":
+        return MciBackend()
+
+    try:
+        return GstreamerBackend()
+    except (ImportError, ValueError) as error:
+        print(f"GStreamer not availible ({error}), using playsound")
+        return PlaysoundBackend()
+
+
+
+class AfplayBackend:
+    # use mac specific afplay command
+
+    def load(self, location):
+        return {
+            "location": location,
+            "volume": 1.0,
+            "process": None
+        }
+
+    def play(self, clip):
+        clip["process"] = subprocess.Popen([ "afplay", "-v", str(clip["volume"]), clip["location"] ])
+
+    def stop(self, clip):
+        if clip["process"] is not None:
+            clip["process"].terminate()
+            clip["process"].wait()
+
+    def set_volume(self, clip, volume):
+        # afplay can't change volume once it has started
+        clip["volume"] = volume
+
+
+
+class MciBackend:
+    # uses the windows media control interface like playsound does
+
+    def __init__(self):
+        from ctypes import windll
+
+        self.winmm = windll.winmm
+        self.clip_count = 0
+
+    def command(self, command):
+        from ctypes import create_unicode_buffer
+
+        result = create_unicode_buffer(255)
+        error = self.winmm.mciSendStringW(command, result, 254, 0)
+
+        if error:
+            error_text = create_unicode_buffer(255)
+            self.winmm.mciGetErrorStringW(error, error_text, 254)
+            raise RuntimeError(f"MCI error {error}: {error_text.value}")
+
+        return result.value
+
+    def load(self, location):
+        self.clip_count += 1
+        alias = f"musicgame{self.clip_count}"
+
+        self.command(f'open "{os.path.abspath(location)}" type mpegvideo alias {alias}')
+        return alias
+
+    def play(self, clip):
+        self.command(f"play {clip} from 0")
+
+    def stop(self, clip):
+        self.command(f"stop {clip}")
+        self.command(f"close {clip}")
+
+    def set_volume(self, clip, volume):
+        self.command(f"setaudio {clip} volume to {int(volume * 1000)}")
+
+
+
+class GstreamerBackend:
+    # the same playbin element that playsound uses on linux
+
+    def __init__(self):
+        import gi
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+
+        Gst.init(None)
+        self.Gst = Gst
+
+    def load(self, location):
+        from urllib.request import pathname2url
+
+        clip = self.Gst.ElementFactory.make("playbin", None)
+        clip.props.uri = "file://" + pathname2url(os.path.abspath(location))
+
+        # paused gets the file opened and decoding so playing is instant
+        clip.set_state(self.Gst.State.PAUSED)
+        return clip
+
+    def play(self, clip):
+        clip.set_state(self.Gst.State.PLAYING)
+
+    def stop(self, clip):
+        clip.set_state(self.Gst.State.NULL)
+
+    def set_volume(self, clip, volume):
+        clip.props.volume = volume
+
+
+
+class PlaysoundBackend:
+    # use playsound inside of a subprocess as you are unable to control it via
+    # the playsound module, only used if nothing else is availible
+
+    def load(self, location):
+        return {
+            "location": location,
+            "process": None
+        }
+
+    def play(self, clip):
+        import multiprocessing
+        import playsound as ps
+
+        clip["process"] = multiprocessing.Process(target=ps.playsound, args=(clip["location"], ))
+        clip["process"].start()
+
+    def stop(self, clip):
+        # ensure that the process is no longer running
+        if clip["process"] is not None and clip["process"].is_alive():
+            clip["process"].terminate()
+            clip["process"].join()
+
+    def set_volume(self, clip, volume):
+        pass
+
+
+
+# Notified whenever a song finishes downloading, one is shared by every
+# song rather than each having its own event
+song_ready = threading.Condition()
 
 
 class Song:
     """
     This object handles an song location and most of it's
     small amount of required data
+
+    Playlists can have tens of thousands of songs so it uses slots
+    rather than a dictionary for its attributes, and the artists
+    string is interned as the same artists are in lots of songs
     """
 
+    __slots__ = ("id", "raw_name", "name", "blank_name", "matcher", "artists", "location", "url", "downloading", "__weakref__")
+
     def __init__(self, id = None, name=None, artists=None, location=None, url=None):
         self.id = id
+        self.raw_name = name
         self.name = format_songname(name)
-        self.artists = " & ".join(artists)
+        # what is shown while the song is being guessed
+        self.blank_name = blank_songname(self.name)
+        self.matcher = None
+        self.artists = sys.intern(" & ".join(artists))
         self.location = location
         self.url = url
+
+        # True while the song is waiting to be downloaded
+        self.downloading = False
+
+    def mark_downloading(self):
+        self.downloading = True
+
+    def mark_ready(self):
+        with song_ready:
+            self.downloading = False
+            song_ready.notify_all()
+
+    def is_ready(self):
+        return not self.downloading
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Waits for the song's clip to finish downloading
+
+        Returns:
+            True if the song is ready, False if it timed out
+        """
+
+        with song_ready:
+            return song_ready.wait_for(self.is_ready, timeout)
+
+    def guess_matcher(self):
+        # only made once it's needed as most songs in a big playlist
+        # are never guessed
+        if self.matcher is None:
+            self.matcher = GuessMatcher(self.name)
+
+        return self.matcher
@@ -3,16 +3,60 @@
 # by William Neild
 #
 
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Date
+import os
+import sqlite3
+import threading
+
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, inspect, func, Column, Integer, String, ForeignKey, Boolean, Date, DateTime, Float, LargeBinary
 from sqlalchemy.orm import relationship, sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+
+# Set on every connection as it's opened. WAL lets the downloader threads
+# read while results and playlists are being written, and with WAL a
+# write only needs syncing to disk at checkpoints
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "busy_timeout=5000",
+    "temp_store=MEMORY",
+    "cache_size=-8000"
+)
+
+# connections are kept open in a pool and handed to whichever thread
+# needs one instead of a new one being opened every time
+db_engine = create_engine("sqlite:///main.db", poolclass=QueuePool, connect_args={"check_same_thread": False})
+
 
+@event.listens_for(db_engine, "connect")
+def set_sqlite_pragmas(connection, connection_record):
+    cursor = connection.cursor()
+
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+
+    cursor.close()
 
-db_engine = create_engine("sqlite:///main.db")
 
 session_factory = sessionmaker(bind=db_engine)
 Session = scoped_session(session_factory)
-db_session = Session()
+
+# the scoped session itself, so every thread that uses it (like the
+# gui's Timer threads) gets a session of its own
+db_session = Session
+
+
+def release_session():
+    """
+    Closes the current thread's session once it's finished with the
+    database, the main thread keeps its session for the whole game
+    """
+
+    if threading.current_thread() is not threading.main_thread():
+        Session.remove()
 
 Base = declarative_base(bind=db_engine)
 
@@ -36,17 +80,13 @@ class Result(Base):
     questions_incorrect = Column("incorrect", Integer)
     score = Column("score", Integer)
 
-# TODO:
-# Create a songs and playlists database table so that the songs and
-# playlists can be stored so that we are not constantly querieing the
-# spotify api for data which will cause lots of extra time starting
-# up the application that shouldn't be needed.
-# ALSO: possibly store audio as a binary blob in the db to prevent
+# Songs and playlists are stored so that we are not constantly querieing
+# the spotify api for data which caused lots of extra time starting up
+# the application that shouldn't be needed.
+# Audio can also be stored as a binary blob in the db to prevent
 # files cluttering and make it easier to delete when theyre no longer
 # in the playlist
 
-# NOTE: Not enough time to implement this
-
 class Song(Base):
     __tablename__ = "songs"
     id = Column("id", String, primary_key=True)
@@ -61,9 +101,272 @@ class Playlist(Base):
     __tablename__ = "playlists"
     id = Column("id", String, primary_key=True)
     last_updated = Column("last_updated", Date)
+    snapshot_id = Column("snapshot_id", String)
 
     songs = relationship("Song", backref="playlist")
+    tracks = relationship("PlaylistSong", order_by="PlaylistSong.position", cascade="all, delete-orphan")
+
+
+class PlaylistSong(Base):
+    # a song can be in more than one playlist so the order of the
+    # songs in each playlist is kept in its own table
+    __tablename__ = "playlist_songs"
+    playlist_id = Column("playlist", String, ForeignKey("playlists.id"), primary_key=True)
+    position = Column("position", Integer, primary_key=True)
+    song_id = Column("song", String, ForeignKey("songs.id"))
+
+    song = relationship("Song")
+
+
+class SongAudio(Base):
+    __tablename__ = "song_audio"
+    song_id = Column("song", String, primary_key=True)
+    size = Column("size", Integer)
+    data = Column("data", LargeBinary)
+    # whether the id3 tag has been converted to v2.3 for playing
+    tags_converted = Column("tags_converted", Boolean)
+
+
+class Asset(Base):
+    # index of the clips saved in the assets folder so we don't have
+    # to check the folder for every song
+    __tablename__ = "assets"
+    song_id = Column("song", String, primary_key=True)
+    size = Column("size", Integer)
+    hash = Column("hash", String)
+    downloaded = Column("downloaded", DateTime)
+    last_played = Column("last_played", DateTime)
+    playlist_id = Column("playlist", String)
+    tags_converted = Column("tags_converted", Boolean)
+    # the file's modified time when it was last hashed, it's only
+    # hashed again if this changes
+    modified = Column("modified", Float)
+    # size of the clip's decoded wav in assets/decoded, which counts
+    # towards the budget too. Clips kept in the database have the size
+    # of their blob and no hash
+    decoded_size = Column("decoded_size", Integer)
+
+
+# The location given to songs which have their audio in the database
+AUDIO_LOCATION_PREFIX = "database:"
+
+# Incremental blob io was added to sqlite3 in python 3.11
+AUDIO_BLOBS_SUPPORTED = hasattr(sqlite3.Connection, "blobopen")
+
+AUDIO_CHUNK_SIZE = 64 * 1024
+
+
+def store_audio(song_id, file_path, tags_converted=False):
+    """
+    Copies an audio file into the song_audio table using sqlite's
+    incremental blob io, the row is created full of zeros at the right
+    size and then written a chunk at a time so that the whole file is
+    never held in memory
+
+    Returns:
+        the location to give the song
+    """
+
+    file_size = os.path.getsize(file_path)
+    connection = db_engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM song_audio WHERE song = ?", (song_id, ))
+        cursor.execute("INSERT INTO song_audio (song, size, data, tags_converted) VALUES (?, ?, zeroblob(?), ?)", (song_id, file_size, file_size, tags_converted))
+        row_id = cursor.lastrowid
+
+        with connection.connection.blobopen("song_audio", "data", row_id) as blob:
+            with open(file_path, "rb") as audio_file:
+                for chunk in iter(lambda: audio_file.read(AUDIO_CHUNK_SIZE), b""):
+                    blob.write(chunk)
+
+        connection.commit()
+    finally:
+        connection.close()
+
+    return f"{AUDIO_LOCATION_PREFIX}{song_id}"
+
+
+def read_audio(song_id):
+    """
+    Reads the audio of a song out of the database a chunk at a time
+
+    Yields:
+        chunks of bytes from the start of the audio to the end
+    """
+
+    connection = db_engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT rowid FROM song_audio WHERE song = ?", (song_id, ))
+        row = cursor.fetchone()
+
+        if row is not None:
+            with connection.connection.blobopen("song_audio", "data", row[0], readonly=True) as blob:
+                for chunk in iter(lambda: blob.read(AUDIO_CHUNK_SIZE), b""):
+                    yield chunk
+    finally:
+        connection.close()
+
+
+def has_audio(song_id, tags_converted=False):
+    # uses its own connection as this is called from the downloader threads
+    connection = db_engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+
+        # clips stored before their tags were converted can be left out
+        if tags_converted:
+            cursor.execute("SELECT 1 FROM song_audio WHERE song = ? AND tags_converted", (song_id, ))
+        else:
+            cursor.execute("SELECT 1 FROM song_audio WHERE song = ?", (song_id, ))
+
+        return cursor.fetchone() is not None
+    finally:
+        connection.close()
+
+
+def stored_audio_sizes():
+    """
+    Returns:
+        a dictionary of song id to the size of its audio for every
+        song with its audio in the database
+    """
+
+    connection = db_engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT song, size FROM song_audio")
+        return dict(cursor.fetchall())
+    finally:
+        connection.close()
+
+
+def remove_audio(song_ids):
+    connection = db_engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+
+        # sqlite can only take so many values in one query
+        for start in range(0, len(song_ids), 500):
+            song_id_chunk = song_ids[start:start + 500]
+            cursor.execute(f"DELETE FROM song_audio WHERE song IN ({', '.join('?' * len(song_id_chunk))})", song_id_chunk)
+
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def get_asset_index():
+    """
+    Gets every saved clip from the asset index in one query
+
+    Returns:
+        a dictionary of song id to Asset
+    """
+
+    # a session of its own as this is used from the downloader threads
+    session = session_factory(expire_on_commit=False)
+
+    try:
+        return {asset.song_id: asset for asset in session.query(Asset).all()}
+    finally:
+        session.close()
+
+
+# More than one Downloader can finish at once, merge looks for a clip
+# and then adds it so two of them saving the same clip would clash
+asset_index_lock = threading.Lock()
+
+
+def save_assets(assets, playlist_id, song_ids):
+    """
+    Adds new clips to the asset index and marks every song in
+    song_ids as last being used by playlist_id
+    """
+
+    with asset_index_lock:
+        session = session_factory()
+
+        try:
+            for asset in assets:
+                session.merge(asset)
+
+            session.flush()
+
+            # sqlite can only take so many values in one query
+            for start in range(0, len(song_ids), 500):
+                song_id_chunk = song_ids[start:start + 500]
+                session.query(Asset).filter(Asset.song_id.in_(song_id_chunk)).update({Asset.playlist_id: playlist_id}, synchronize_session=False)
+
+            session.commit()
+        finally:
+            session.close()
+
+
+def remove_assets(song_ids):
+    session = session_factory()
+
+    try:
+        for start in range(0, len(song_ids), 500):
+            song_id_chunk = song_ids[start:start + 500]
+            session.query(Asset).filter(Asset.song_id.in_(song_id_chunk)).delete(synchronize_session=False)
+
+        session.commit()
+    finally:
+        session.close()
+
+
+def least_recently_used_assets():
+    """
+    Returns:
+        every Asset ordered from the one used longest ago to the most
+        recently used, a clip that has never been played counts as
+        being used when it was downloaded
+    """
+
+    session = session_factory(expire_on_commit=False)
+
+    try:
+        last_used = func.coalesce(Asset.last_played, Asset.downloaded)
+        return session.query(Asset).order_by(last_used).all()
+    finally:
+        session.close()
+
+
+def mark_played(song_id):
+    session = session_factory()
+
+    try:
+        session.query(Asset).filter_by(song_id=song_id).update({Asset.last_played: datetime.now()}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
+def add_missing_columns():
+    """
+    create_all only creates tables which don't exist yet, so any
+    columns added to a table after it was first created are added
+    to it here
+    """
+
+    inspector = inspect(db_engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing_columns = [column["name"] for column in inspector.get_columns(table.name)]
+
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db_engine.dialect)
+                db_engine.execute(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
 
 
 # Create databases and tables if not already exist
 Base.metadata.create_all()
+add_missing_columns()
@@ -10,8 +10,20 @@ networking or gui class such as logging in and other helper
 functions.
 """
 
-from musicGame.database import db_session, User, Result
-from musicGame.networking import Spotify, Downloader
+import heapq
+import os
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
+
+from musicGame.database import db_session, Session, release_session, User, Result, Playlist, PlaylistSong
+from musicGame.database import Song as SavedSong
+from musicGame.database import has_audio, AUDIO_LOCATION_PREFIX
+from musicGame.networking import Spotify, Downloader, remove_clips, song_ids_in_use
 
 from sqlalchemy import desc
 
@@ -20,6 +32,38 @@ from sqlalchemy import desc
 # place where it should be accessed
 spotify = Spotify()
 
+# How long a playlist saved in the database is used for before
+# it gets updated from spotify in the background
+PLAYLIST_MAX_AGE = timedelta(days=1)
+
+# How many songs need to be downloaded before the game can start,
+# the rest carry on downloading while it's being played
+PROGRESSIVE_START_SONGS = 3
+
+# How long in seconds a song plays for after a guess, used by both the
+# engine and the gui
+SCREEN_DURIATION = 6
+
+# After the last wrong guess the song plays for this many times longer
+LAST_GUESS_MULTIPLIER = 2
+
+# The longest a clip is ever played for, decoded clips are cut to this length
+DECODED_CLIP_LENGTH = SCREEN_DURIATION * LAST_GUESS_MULTIPLIER
+
+# The playlists that can be chosen on the main page, more can be added
+# with "playlists" in config.json
+PLAYLISTS = {
+    "37i9dQZF1DXcBWIGoYBM5M": "Today's Top Hits",
+    "5MN1X3chNX5Dxk8Pav3Dtu": "Now That's What I Call Music",
+    "37i9dQZF1DX0Yxoavh5qJV": "Christmas Hits"
+}
+
+DEFAULT_PLAYLIST = "37i9dQZF1DXcBWIGoYBM5M"
+
+# How many loaded playlists are kept in memory, switching back to one
+# of them doesn't need the database or spotify
+PLAYLIST_CACHE_SIZE = 4
+
 
 
 def login(username, password):
@@ -113,34 +157,47 @@ def register(username, password, password_confirmation, first_name, last_name):
 
 
 def save_result(user_id, total_score, correct_guesses, incorrect_guesses):
-    from sqlalchemy.orm import sessionmaker, scoped_session
-    from musicGame.database import db_engine
+    # called once the game is over, which is on one of the engine's
+    # Timer threads, so it gets that thread's session
+    try:
+        new_result = Result(user_id=user_id, score=total_score, questions_correct=correct_guesses, questions_incorrect=incorrect_guesses)
+        db_session.add(new_result)
+        db_session.commit()
+    finally:
+        release_session()
 
-    session_factory = sessionmaker(bind=db_engine)
-    Session = scoped_session(session_factory)
-    db_session = Session()
 
-    new_result = Result(user_id=user_id, score=total_score, questions_correct=correct_guesses, questions_incorrect=incorrect_guesses)
-    db_session.add(new_result)
-    db_session.commit()
 
+def get_results(user_id):
+    try:
+        user_results = db_session.query(Result).filter_by(user_id=user_id).all()
+    finally:
+        release_session()
 
+    return user_results
 
-def get_results(user_id):
-    from sqlalchemy.orm import sessionmaker, scoped_session
-    from musicGame.database import db_engine
 
-    session_factory = sessionmaker(bind=db_engine)
-    Session = scoped_session(session_factory)
-    db_session = Session()
 
-    user_results = db_session.query(Result).filter_by(user_id=user_id).all()
-    
-    return user_results
 
+# List of basic 'from -> to' values to remove from song names, they
+# are replaced in this order
+SONGNAME_TERMS = (
+    ("radio edit", ""),
+    (" - ", " "),
+    (",", " "),
+    ("remastered", ""),
+    ("[remix]", ""),
+    ("film version", ""),
+    (".", ""),
+    ("spider-man: into the spider-verse", ""),
+    ("from \"watership down\"", "")
+)
 
+# How many formatted song names are remembered
+SONGNAME_CACHE_SIZE = 16384
 
 
+@lru_cache(maxsize=SONGNAME_CACHE_SIZE)
 def format_songname(song_name):
     """
     Basic function to nicely format song names from
@@ -165,29 +222,31 @@ def format_songname(song_name):
     Returns:
         returns a string which has been formated by removing as much
         of the useless information out of the song title which shouldn't
-        realy be there in the first place.
+        realy be there in the first place. The same name always
+        formats the same way so results are remembered
     """
 
     song_name = song_name.lower()
     
     # Remove brackets from the string
 
-    num_brackets = song_name.count("(")
+    if "(" in song_name:
+        for bracket_pairs in range(song_name.count("(")):
+            bracket_start = song_name.find("(")
+            bracket_end = song_name.find(")")
 
-    for bracket_pairs in range(num_brackets):
-        bracket_start = song_name.find("(")
-        bracket_end = song_name.find(")")
-
-        if bracket_start != -1 and bracket_end != -1:
-            song_name = song_name.replace(song_name[bracket_start:bracket_end + 1], "")
+            if bracket_start != -1 and bracket_end != -1:
+                song_name = song_name.replace(song_name[bracket_start:bracket_end + 1], "")
 
     # Remove common remix string
 
     remix_start = song_name.find(" - ")
-    remix_end = song_name.find("remix")
 
-    if remix_start != -1 and remix_end != -1:
-        song_name = song_name.replace(song_name[remix_start:remix_end + 5], "")
+    if remix_start != -1:
+        remix_end = song_name.find("remix")
+
+        if remix_end != -1:
+            song_name = song_name.replace(song_name[remix_start:remix_end + 5], "")
 
 
     # Remove feat out of brackets string
@@ -197,22 +256,10 @@ def format_songname(song_name):
     if feat_start != -1:
         song_name = song_name.replace(song_name[feat_start: ], "")
 
-    # List of basic 'from -> to' values to remove
-
-    terms = [
-        ("radio edit", ""),
-        (" - ", " "),
-        (",", " "),
-        ("remastered", ""),
-        ("[remix]", ""),
-        ("film version", ""),
-        (".", ""),
-        ("spider-man: into the spider-verse", ""),
-        ("from \"watership down\"", "")
-    ]
-
-    for term in terms:
-        song_name = song_name.replace(term[0], term[1])
+    # checking first is quicker than replacing when the term isn't there
+    for term, replacement in SONGNAME_TERMS:
+        if term in song_name:
+            song_name = song_name.replace(term, replacement)
 
     # this should fix double spaces which mess up if the user
     # doesnt guess with an exta space
@@ -237,36 +284,429 @@ def blank_songname(song_name):
         returns a string of the song name thats ready to be guessed
     """
 
-    word_list = song_name.split(" ")
-    song_guess = []
+    return " ".join([blank_word(word) for word in song_name.split(" ")])
+
+
+
+def blank_word(word):
+    # most words are only letters so can be blanked all at once
+    if word.isalpha():
+        return word[0].upper() + "_ " * (len(word) - 1)
+
+    word_guess = ""
+    had_first = False
     
-    for word in word_list:
-        word_guess = ""
-        had_first = False
-        
-        for char in word:
-            if char.isalpha():
-                if not had_first:
-                    word_guess += char.upper()
-                    had_first = True
-                else:
-                    word_guess += "_ "
+    for char in word:
+        if char.isalpha():
+            if not had_first:
+                word_guess += char.upper()
+                had_first = True
             else:
-                word_guess += char
+                word_guess += "_ "
+        else:
+            word_guess += char
 
-        song_guess.append(word_guess)
+    return word_guess
 
-    return " ".join(song_guess)
 
 
+def common_prefix_length(first, second):
+    # found by comparing halves so it's done by string comparisons
+    # rather than a character at a time
+    low = 0
+    high = min(len(first), len(second))
 
-def load_playlist(playlist_id="37i9dQZF1DXcBWIGoYBM5M"):
-    from musicGame.audio import Song
+    while low < high:
+        middle = (low + high + 1) // 2
+
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
 
+    return low
+
+
+
+# How many typos a guess can have, one for every this many characters
+# in the song name up to GUESS_MAX_TYPOS
+GUESS_CHARACTERS_PER_TYPO = 8
+GUESS_MAX_TYPOS = 3
+
+
+class GuessMatcher:
+    """
+    Checks guesses against a song name, allowing a few typos. The edit
+    distance is worked out with Myers' bit-parallel algorithm so each
+    character of the guess is one set of operations on whole numbers
+    (one bit for each character of the name) and it gives up as soon
+    as the guess can't be close enough
+
+    Args:
+        song_name: The formatted song name the guesses should match
+
+        max_distance: How many insertions, deletions or substitutions
+                      a guess can have, if None it depends on the length
+                      of the name (Default: None)
     """
-    This function gets the playlist from spotify and returns
-    a list of Audio objects which can be played in the music
-    Player.
+
+    def __init__(self, song_name, max_distance=None):
+        self.answer = " ".join(song_name.lower().split())
+
+        if max_distance is None:
+            max_distance = min(len(self.answer) // GUESS_CHARACTERS_PER_TYPO, GUESS_MAX_TYPOS)
+
+        self.max_distance = max_distance
+
+        # a bit mask for each character of where it is in the answer
+        self.positions = {}
+
+        for position, char in enumerate(self.answer):
+            self.positions[char] = self.positions.get(char, 0) | (1 << position)
+
+    def matches(self, guess):
+        return self.distance(guess) is not None
+
+    def distance(self, guess):
+        """
+        Returns:
+            the edit distance between the guess and the song name, or
+            None if it's more than max_distance
+        """
+
+        guess = " ".join(guess.lower().split())
+
+        if guess == self.answer:
+            return 0
+
+        # every extra or missing character is at least one edit
+        if abs(len(guess) - len(self.answer)) > self.max_distance:
+            return None
+
+        # the start and end that are the same don't change the distance,
+        # so only the part between them needs checking
+        start = common_prefix_length(guess, self.answer)
+        end = common_prefix_length(guess[start:][::-1], self.answer[start:][::-1])
+
+        guess = guess[start:len(guess) - end]
+        answer_length = len(self.answer) - start - end
+
+        if answer_length == 0 or len(guess) == 0:
+            distance = max(answer_length, len(guess))
+            return distance if distance <= self.max_distance else None
+
+        mask = (1 << answer_length) - 1
+        last_bit = 1 << (answer_length - 1)
+        positive = mask
+        negative = 0
+        distance = answer_length
+        remaining = len(guess)
+
+        for char in guess:
+            matched = (self.positions.get(char, 0) >> start) & mask
+            vertical = matched | negative
+            diagonal = (((matched & positive) + positive) ^ positive) | matched
+            horizontal_positive = negative | (~(diagonal | positive) & mask)
+            horizontal_negative = positive & diagonal
+
+            if horizontal_positive & last_bit:
+                distance += 1
+            elif horizontal_negative & last_bit:
+                distance -= 1
+
+            remaining -= 1
+
+            # each character left can only take one off the distance
+            if distance - remaining > self.max_distance:
+                return None
+
+            horizontal_positive = ((horizontal_positive << 1) | 1) & mask
+            horizontal_negative = (horizontal_negative << 1) & mask
+            positive = horizontal_negative | (~(vertical | horizontal_positive) & mask)
+            negative = horizontal_positive & vertical
+
+        if distance > self.max_distance:
+            return None
+
+        return distance
+
+
+
+# The points for getting a song right on each attempt, the game is
+# over when the last attempt is wrong
+ATTEMPT_SCORES = (3, 1)
+
+
+class TimerClock:
+    # runs each callback on a timer thread after its delay, this is
+    # what the real game uses
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.start()
+        return timer
+
+
+
+class SimulatedClock:
+    """
+    A clock for playing games without waiting, callbacks are queued up
+    and run() goes straight to when each one is due and runs it
+    """
+
+    def __init__(self):
+        self.time = 0
+        self.queue = []
+        self.count = 0
+
+    def call_later(self, delay, callback):
+        # the count keeps callbacks due at the same time in order
+        heapq.heappush(self.queue, (self.time + delay, self.count, callback))
+        self.count += 1
+
+    def run(self):
+        while len(self.queue) > 0:
+            self.time, count, callback = heapq.heappop(self.queue)
+            callback()
+
+
+
+class GameEngine:
+    """
+    Plays a game through a list of songs without any UI: which song is
+    being guessed, the attempts, the score and when the game is over
+
+    Listeners are told what to show with listener(event, song, clip_duriation)
+    where event is one of:
+        "guess"     -> song is ready to be guessed
+        "correct"   -> the guess was right
+        "incorrect" -> the guess was wrong
+        "game_over" -> the game has finished, song is None
+    and clip_duriation is how long to play the song's clip for, or None
+    if it shouldn't be played
+
+    Args:
+        songs: The list of Song objects to play through
+
+        clock: What the pauses after each guess are timed with, anything
+               with a call_later(delay, callback) method (Default: TimerClock)
+
+        screen_duriation: How long in seconds the song will play for if
+                          the user is correct / incorrect (Default: SCREEN_DURIATION)
+
+        no_song_decrease_multiplier: How much shorter the pause is for a song
+                                     without a clip (Default: 3)
+    """
+
+    def __init__(self, songs, clock=None, screen_duriation=SCREEN_DURIATION, no_song_decrease_multiplier=3):
+        self.songs = songs
+        self.clock = clock if clock is not None else TimerClock()
+        self.screen_duriation = screen_duriation
+        self.no_song_decrease_multiplier = no_song_decrease_multiplier
+        self.listeners = []
+
+        self.state = "waiting"
+        self.current_song = None
+        self.attempts = 0
+        self.total_score = 0
+        self.total_correct = 0
+        self.total_incorrect = 0
+        self.completed = False
+
+    @property
+    def song(self):
+        if self.current_song is None:
+            return None
+
+        return self.songs[self.current_song]
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, clip_duriation=None):
+        song = self.song if event != "game_over" else None
+
+        for listener in self.listeners:
+            listener(event, song, clip_duriation)
+
+    def start(self):
+        self.current_song = 0
+        self.attempts = 0
+        self.total_score = 0
+        self.total_correct = 0
+        self.total_incorrect = 0
+        self.completed = False
+
+        if len(self.songs) == 0:
+            self.game_over(True)
+        else:
+            self.show_song()
+
+    def show_song(self):
+        self.state = "guessing"
+        self.notify("guess")
+
+    def pause_duriation(self, song):
+        # the pause is shorter if there's no clip to listen to
+        if song.location is None:
+            return self.screen_duriation / self.no_song_decrease_multiplier
+
+        return self.screen_duriation
+
+    def guess(self, guess):
+        """
+        Checks a guess for the current song, guesses made while the
+        result of the last one is being shown are ignored
+
+        Returns:
+            True if it was right, False if it was wrong or None if
+            it was ignored
+        """
+
+        if self.state != "guessing":
+            return None
+
+        song = self.song
+        duriation = self.pause_duriation(song)
+        self.attempts += 1
+
+        if song.guess_matcher().matches(guess):
+            self.total_score += ATTEMPT_SCORES[self.attempts - 1]
+            self.total_correct += 1
+
+            self.state = "correct"
+            self.notify("correct", duriation)
+            self.clock.call_later(duriation, self.next_song)
+            return True
+
+        self.total_incorrect += 1
+        self.state = "incorrect"
+
+        if self.attempts == len(ATTEMPT_SCORES):
+            # let them hear what it was before the game ends
+            self.notify("incorrect", self.screen_duriation * LAST_GUESS_MULTIPLIER)
+            self.clock.call_later(duriation, lambda: self.game_over(False))
+        else:
+            self.notify("incorrect")
+            self.clock.call_later(duriation, self.show_song)
+
+        return False
+
+    def next_song(self):
+        self.current_song += 1
+        self.attempts = 0
+
+        if self.current_song < len(self.songs):
+            self.show_song()
+        else:
+            self.game_over(True)
+
+    def game_over(self, completed):
+        self.state = "game_over"
+        self.completed = completed
+        self.notify("game_over")
+
+
+
+class PlaylistLibrary:
+    """
+    The playlists that can be played, each one is only loaded the first
+    time it's chosen and the most recently chosen are kept in memory
+
+    The clips are shared by every playlist through the assets folder,
+    so a song in more than one playlist is only downloaded once
+
+    Args:
+        playlists: A dictionary of playlist ids to the names shown for
+                   them (Default: PLAYLISTS and any from config.json)
+        cache_size: How many loaded playlists are kept (Default: PLAYLIST_CACHE_SIZE)
+        sample_size: Passed on to load_playlist (Default: None)
+    """
+
+    def __init__(self, playlists=None, cache_size=PLAYLIST_CACHE_SIZE, sample_size=None):
+        if playlists is None:
+            playlists = {**PLAYLISTS, **spotify.playlists}
+
+        self.playlists = playlists
+        self.cache_size = cache_size
+        self.sample_size = sample_size
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def names(self):
+        return list(self.playlists.values())
+
+    def playlist_id(self, name):
+        for playlist_id, playlist_name in self.playlists.items():
+            if playlist_name == name:
+                return playlist_id
+
+        return None
+
+    def is_loaded(self, playlist_id):
+        with self.lock:
+            return playlist_id in self.loaded
+
+    def get(self, playlist_id):
+        """
+        Gets the songs of a playlist, loading it if it isn't one of
+        the ones kept in memory
+
+        Returns:
+            a list of Song objects, or None if it couldn't be loaded
+        """
+
+        with self.lock:
+            song_list = self.loaded.get(playlist_id)
+
+            if song_list is not None:
+                self.loaded.move_to_end(playlist_id)
+
+        if song_list is not None:
+            # another playlist could have needed the space for its clips,
+            # the whole playlist is passed so the rest of it is kept
+            evicted = missing_clips(song_list)
+
+            if len(evicted) > 0 and spotify.authenticated:
+                print(f"Downloading {len(evicted)} clips again for playlist {playlist_id}")
+                download_songs(playlist_id, song_list)
+
+            return song_list
+
+        song_list = load_playlist(playlist_id, self.sample_size)
+
+        if song_list is None:
+            return None
+
+        with self.lock:
+            self.loaded[playlist_id] = song_list
+            self.loaded.move_to_end(playlist_id)
+
+            while len(self.loaded) > self.cache_size:
+                self.loaded.popitem(last=False)
+
+        return song_list
+
+
+
+def load_playlist(playlist_id=DEFAULT_PLAYLIST, sample_size=None):
+    """
+    This function gets the playlist and returns a list of Audio
+    objects which can be played in the music Player.
+
+    The playlist is loaded from the database if it has been saved
+    there before. If it's older than PLAYLIST_MAX_AGE it's still used
+    but it gets updated from spotify in the background, ready for next
+    time. Spotify is only waited on when the playlist has never been
+    saved, so the game can be played offline once it has.
+
+    If sample_size is given only that many songs are picked at random
+    and only their clips are downloaded. When the playlist hasn't been
+    saved only the pages of it they are on are requested, so a short
+    game of a huge playlist doesn't wait for all of it.
+
+    None is returned if the playlist hasn't been saved and spotify
+    can't be reached.
 
     Good Playlists:
         37i9dQZF1DXcBWIGoYBM5M -> 40 songs   -> Official UK Top 40 [Default Playlist]
@@ -275,20 +715,237 @@ def load_playlist(playlist_id="37i9dQZF1DXcBWIGoYBM5M"):
         37i9dQZF1DXcBWIGoYBM5M -> 50+ songs  -> Spotify: Today's Top Hits
     """
 
-    game_playlist = spotify.get_playlist(playlist_id)
+    start_time = time.time()
 
-    playlist_song_list = [song["track"] for song in game_playlist["tracks"]["items"]]
-    song_list = []
+    saved_playlist = db_session.query(Playlist).filter_by(id=playlist_id).first()
 
-    for song in playlist_song_list:
-        artist_list = [artist["name"] for artist in song["album"]["artists"]]
-        song_id = song["id"]
-        url = song["preview_url"]
-        song_object = Song(id = song_id, name = song["name"], artists = artist_list, url = url)
-        song_list.append(song_object)
+    if saved_playlist is not None and len(saved_playlist.tracks) > 0:
+        saved_tracks = saved_playlist.tracks
+
+        if sample_size is not None:
+            saved_tracks = random.sample(saved_tracks, min(sample_size, len(saved_tracks)))
+
+        song_list = saved_songs(saved_tracks)
+        source = "database"
+
+        if date.today() - saved_playlist.last_updated >= PLAYLIST_MAX_AGE and spotify.authenticated:
+            print("Saved playlist is out of date, updating in the background")
+            refresh_thread = threading.Thread(target=refresh_playlist, name="PlaylistRefresh", args=(playlist_id, ))
+            refresh_thread.daemon = True
+            refresh_thread.start()
+    elif sample_size is not None:
+        song_list = spotify.get_playlist_sample(playlist_id, sample_size, convert=song_from_track)
+
+        if song_list is False:
+            print("Can't load the playlist, it hasn't been saved and spotify can't be reached")
+            return None
+
+        # only part of the playlist, so it isn't saved
+        source = "spotify (sampled)"
+    else:
+        fetched_playlist = fetch_playlist(playlist_id)
+
+        if not fetched_playlist:
+            print("Can't load the playlist, it hasn't been saved and spotify can't be reached")
+            return None
+
+        song_list, snapshot_id = fetched_playlist
+        source = "spotify"
+
+    if spotify.authenticated:
+        download_songs(playlist_id, song_list)
+
+        if source == "spotify":
+            save_playlist(playlist_id, song_list, snapshot_id, db_session)
+    else:
+        # offline, so only use the clips that we already have
+        for song in song_list:
+            song.location = saved_location(song)
+
+    print(f"Loaded {len(song_list)} songs from {source} in {time.time() - start_time:.2f}s")
     
-    # Download all songs to the assets directory
-    downloader = Downloader(8)
-    downloader.start(song_list)
+    return song_list
+
+
+
+def fetch_playlist(playlist_id):
+    """
+    Gets the playlist from spotify and converts each track to a
+    Song object as it's read, tracks which are no longer availible
+    are skipped
+
+    Returns:
+        a tuple of the list of songs and the snapshot id of the playlist
+        or False if spotify couldn't be reached
+    """
+
+    game_playlist = spotify.get_playlist(playlist_id, convert=song_from_track)
+
+    if not game_playlist:
+        return False
     
+    return (game_playlist["tracks"]["items"], game_playlist.get("snapshot_id"))
+
+
+
+def song_from_track(playlist_track):
+    from musicGame.audio import Song
+
+    song = playlist_track["track"]
+
+    if song is None:
+        return None
+
+    artist_list = [artist["name"] for artist in song["album"]["artists"]]
+    return Song(id = song["id"], name = song["name"], artists = artist_list, url = song["preview_url"])
+
+
+
+def refresh_playlist(playlist_id):
+    """
+    Updates a saved playlist from spotify, this is ran in its own
+    thread so it uses its own database session.
+
+    Only the snapshot id is requested to begin with and the whole
+    playlist is only requested if that has changed, then only the
+    clips for songs that weren't in the playlist before are downloaded
+    """
+
+    try:
+        session = Session()
+        playlist = session.query(Playlist).filter_by(id=playlist_id).first()
+
+        snapshot_id = spotify.get_playlist_snapshot(playlist_id)
+        fetched_playlist = False
+
+        if snapshot_id is None:
+            # spotify is down or throttling us, the saved one will do
+            print(f"Couldn't check saved playlist {playlist_id}, using it anyway")
+        elif snapshot_id == playlist.snapshot_id:
+            print(f"Saved playlist {playlist_id} hasn't changed")
+            playlist.last_updated = date.today()
+            session.commit()
+        else:
+            fetched_playlist = fetch_playlist(playlist_id)
+
+        if fetched_playlist:
+            song_list, snapshot_id = fetched_playlist
+
+            saved_ids = set(track.song_id for track in playlist.tracks)
+            new_songs = [song for song in song_list if song.id not in saved_ids]
+
+            downloader = Downloader(8, storage=spotify.audio_storage, playlist_id=playlist_id, budget=spotify.asset_budget, decode_length=decode_length())
+            downloader.start(new_songs)
+
+            save_playlist(playlist_id, song_list, snapshot_id, session)
+            print(f"Updated saved playlist {playlist_id}, {len(new_songs)} new songs")
+    finally:
+        release_session()
+
+
+
+def save_playlist(playlist_id, song_list, snapshot_id, session):
+    """
+    Saves the songs in a playlist to the database in the order they
+    are in the playlist and marks the playlist as updated today.
+
+    If the playlist was already saved only the positions which have
+    a different song are changed, new songs are added and songs that
+    aren't in any playlist anymore are removed along with their clips
+    """
+
+    playlist = session.query(Playlist).filter_by(id=playlist_id).first()
+
+    if playlist is None:
+        playlist = Playlist(id=playlist_id)
+        session.add(playlist)
+
+    playlist.last_updated = date.today()
+    playlist.snapshot_id = snapshot_id
+
+    saved_ids = set(track.song_id for track in playlist.tracks)
+    new_ids = set(song.id for song in song_list)
+
+    for song in song_list:
+        if song.id not in saved_ids:
+            saved_ids.add(song.id)
+            saved_song = SavedSong(id=song.id, name=song.raw_name, artists=song.artists, location=song.location, url=song.url, playlist_id=playlist_id)
+            session.merge(saved_song)
+
+    # move songs into their new positions
+    for position, song in enumerate(song_list):
+        if position < len(playlist.tracks):
+            if playlist.tracks[position].song_id != song.id:
+                playlist.tracks[position].song_id = song.id
+        else:
+            playlist.tracks.append(PlaylistSong(position=position, song_id=song.id))
+
+    # the playlist got shorter
+    del playlist.tracks[len(song_list):]
+    session.flush()
+
+    # remove songs which were dropped and aren't in another playlist
+    removed_ids = []
+
+    for song_id in saved_ids - new_ids:
+        if session.query(PlaylistSong).filter_by(song_id=song_id).first() is None:
+            session.query(SavedSong).filter_by(id=song_id).delete()
+            removed_ids.append(song_id)
+
+    session.commit()
+
+    # a game could still be playing one of them
+    in_use = song_ids_in_use()
+    removed_ids = [song_id for song_id in removed_ids if song_id not in in_use]
+
+    if len(removed_ids) > 0:
+        remove_clips(removed_ids)
+
+
+
+def download_songs(playlist_id, song_list):
+    # Download the songs to the assets directory in the order they
+    # are played, this returns once the first few are ready
+    downloader = Downloader(8, storage=spotify.audio_storage, playlist_id=playlist_id, budget=spotify.asset_budget, decode_length=decode_length())
+    downloader.start_background(song_list, PROGRESSIVE_START_SONGS)
+
+
+def missing_clips(song_list):
+    # the songs whose clip files have been deleted since they were downloaded
+    return [song for song in song_list if song.location is not None and not song.location.startswith(AUDIO_LOCATION_PREFIX) and not os.path.exists(song.location)]
+
+
+def decode_length():
+    # how long decoded clips should be, or None if they aren't decoded
+    if spotify.decode_clips:
+        return DECODED_CLIP_LENGTH
+
+    return None
+
+
+def saved_location(song):
+    # where the clip for a song is if it has already been downloaded
+    if spotify.audio_storage == "database":
+        if has_audio(song.id):
+            return f"{AUDIO_LOCATION_PREFIX}{song.id}"
+    else:
+        path = f"assets/{song.id}.mp3"
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+
+def saved_songs(tracks):
+    # converts the tracks of a saved playlist back to Song objects
+    from musicGame.audio import Song
+
+    song_list = []
+
+    for track in tracks:
+        saved_song = track.song
+        song_object = Song(id = saved_song.id, name = saved_song.name, artists = [saved_song.artists], location = saved_song.location, url = saved_song.url)
+        song_list.append(song_object)
+
     return song_list
@@ -7,9 +7,10 @@ from tkinter import *
 from tkinter.ttk import *
 from tkinter.font import Font
 
+import sys
 from threading import Timer
 
-from musicGame.game import login, register, load_playlist, blank_songname, save_result, get_results
+from musicGame.game import login, register, save_result, get_results, GameEngine, PlaylistLibrary, DEFAULT_PLAYLIST, SCREEN_DURIATION, spotify
 from musicGame.audio import Player
 
 
@@ -61,13 +62,18 @@ class Application(Frame):
 
         # setup the audio player
         self.player = Player()
+        self.player.subscribe(self.player_changed)
 
         # how long in seconds the song will play for
         # if the user is correct / incorrect
-        self.screen_duriation = 6
+        self.screen_duriation = SCREEN_DURIATION
         self.no_song_decrease_multiplier = 3
 
-        # GUI / Game State
+        # how long in seconds to wait for a song which is
+        # still downloading before playing without it
+        self.download_timeout = 5
+
+        # GUI State
         self.state = {
             "logged_in": False,
             "user": {
@@ -75,19 +81,18 @@ class Application(Frame):
                 "username": "",
                 "first_name": "",
                 "last_name": ""
-            },
-            "songs": {
-                "current_song": None,
-                "songs_list": []
-            },
-            "game": {
-                "attempts": 0,
-                "total_score": 0,
-                "total_correct": 0,
-                "total_incorrect": 0
             }
         }
 
+        # the scoring and moving between songs is done by the engine
+        self.songs_list = []
+        self.engine = None
+
+        # the playlists that can be chosen, each is loaded when it's first picked
+        self.library = PlaylistLibrary(sample_size=spotify.sample_size)
+        self.playlist_id = DEFAULT_PLAYLIST
+        self.playlist_message = None
+
 		# Setup some fonts
         self.font_default = Font(family="Helvetica", size=12)
         self.font_title = Font(family="Helvetica", size=20, weight="bold")
@@ -105,7 +110,11 @@ class Application(Frame):
         self.style.configure("MusicGame.TEntry", background=Colours.white, borderwidth=0, relief='flat', padding=0, highlightthickness=0)
 
         # Show the loading page while playlists and audio files are being downloaded
-        self.loading_page()
+        self.songs_list = self.loading_page(self.playlist_id)
+
+        # there isn't another playlist to fall back to at startup
+        if self.songs_list is None:
+            sys.exit()
 
         # After that, show the main page
         self.main_page()
@@ -114,50 +123,37 @@ class Application(Frame):
     # # Some utility functions
     # #
 
-    def guess(self, song, guess):
-        # increase attempts straight away
-        attempts = self.state["game"]["attempts"] + 1
-        score = self.state["game"]["total_score"]
-
-        # update the attempts state
-        self.state["game"]["attempts"] = attempts
-
-        if song.name.lower() == guess.lower():
-
-            # add points
-            if attempts == 1:
-                score += 3
-            elif attempts == 2:
-                score += 1
-
-            # update the score state
-            self.state["game"]["total_score"] = score
-
-            self.state["game"]["total_correct"] = self.state["game"]["total_correct"] + 1
-            self.correct_guess(song)
+    def start_game(self):
+        self.engine = GameEngine(self.songs_list, screen_duriation=self.screen_duriation, no_song_decrease_multiplier=self.no_song_decrease_multiplier)
+        self.engine.subscribe(self.game_changed)
+        self.engine.start()
+
+    def game_changed(self, event, song, clip_duriation):
+        # called by the engine whenever something needs to be shown
+        if event == "guess":
+            self.play_page(song)
+        elif event == "correct":
+            self.correct_guess(song, clip_duriation)
+        elif event == "incorrect":
+            self.incorrect_guess(song, clip_duriation)
+        elif event == "game_over":
+            self.game_over()
+
+    def guess(self, guess):
+        self.engine.guess(guess)
+
+    def player_changed(self, state, song):
+        # called by the player whenever it starts or stops a song
+        if song is not None:
+            print(f"Player {state}: {song.name}")
         else:
-            self.state["game"]["total_incorrect"] = self.state["game"]["total_incorrect"] + 1
-            self.incorrect_guess(song)
+            print(f"Player {state}")
 
     def clear_screen(self, root):
         # removes all widgets from the 'root' element
         for widget in root.winfo_children():
             widget.destroy()
 
-    def next_song(self):
-        # updates the gui state
-        song_id = self.state["songs"]["current_song"]
-        song_id += 1
-
-        self.state["game"]["attempts"] = 0
-
-        try:
-            self.state["songs"]["current_song"] = song_id
-            self.play_page()
-        except IndexError:
-            print("Completed playlist")
-            self.game_over("Correct.TLabel")
-
     def user_login(self, username, password):
         self.login_widget.withdraw()
 
@@ -174,6 +170,27 @@ class Application(Frame):
         else:
             self.login_page()
     
+    def choose_playlist(self, name):
+        playlist_id = self.library.playlist_id(name)
+
+        if playlist_id is None or playlist_id == self.playlist_id:
+            return
+
+        # playlists still in the library don't need the loading page
+        if self.library.is_loaded(playlist_id):
+            songs_list = self.library.get(playlist_id)
+        else:
+            songs_list = self.loading_page(playlist_id)
+
+        # keep playing the current playlist if the new one can't be loaded
+        if songs_list is None:
+            self.playlist_message = f"Can't load {name}, it hasn't been saved and spotify can't be reached"
+        else:
+            self.songs_list = songs_list
+            self.playlist_id = playlist_id
+
+        self.main_page()
+
     def user_register(self, username, password, password_confirmation, first_name, last_name):
         self.register_widget.withdraw()
         result = register(username, password, password_confirmation, first_name, last_name)
@@ -205,22 +222,34 @@ class Application(Frame):
 
             spacer = Label(style="MusicGame.TLabel").grid(row=2, columnspan=2)
 
+            # Playlist chooser
+            self.playlist_choice = Combobox(values=self.library.names(), width=48, state="readonly")
+            self.playlist_choice.set(self.library.playlists.get(self.playlist_id, ""))
+            self.playlist_choice.bind("<<ComboboxSelected>>", lambda event: self.choose_playlist(self.playlist_choice.get()))
+            self.playlist_choice.grid(row=3, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+
             # Buttons
-            self.button_play = Button(text="Play", width=50, command=lambda: self.play_page(), style="MusicGame.TButton", cursor=Cursor.hover)
-            self.button_play.grid(row=3, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+            self.button_play = Button(text="Play", width=50, command=self.start_game, style="MusicGame.TButton", cursor=Cursor.hover)
+            self.button_play.grid(row=4, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
 
             self.button_results = Button(text="Results", width=50, command=self.result_page, style="MusicGame.TButton", cursor=Cursor.hover)
-            self.button_results.grid(row=4, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+            self.button_results.grid(row=5, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
             
             self.button_account = Button(text="Account", width=50, command=self.account_page, style="MusicGame.TButton", cursor=Cursor.hover)
-            self.button_account.grid(row=5, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+            self.button_account.grid(row=6, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+
+            # only shown once, the next time the main page is shown it's gone
+            if self.playlist_message is not None:
+                self.playlist_error = Label(text=self.playlist_message, wraplength=400, style="Incorrect.TLabel")
+                self.playlist_error.grid(row=7, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
+                self.playlist_message = None
         else:
 			# Hide the main window as the login page is in a seperate window
             self.root.withdraw()
             self.login_page()
     
 
-    def loading_page(self):
+    def loading_page(self, playlist_id):
         self.clear_screen(self.master)
 
         self.loading_text = Label(text="Loading", font=self.font_title, style="MusicGame.TLabel")
@@ -228,13 +257,12 @@ class Application(Frame):
 
         self.root.update()
         
-        song_playlist = load_playlist()
-
-        self.state["songs"]["songs_list"] = song_playlist
-        self.state["songs"]["current_song"] = 0
+        songs_list = self.library.get(playlist_id)
         
         self.clear_screen(self.master)
 
+        return songs_list
+
 
     def login_page(self):
         self.login_widget = Toplevel(padx=20, pady=5) # New Window
@@ -327,23 +355,37 @@ class Application(Frame):
         register_button.grid(row=6, column=0, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
     
 
-    def play_page(self):
+    def play_page(self, song):
         self.clear_screen(self.root)
 
-        song_id = self.state["songs"]["current_song"]
-        song = self.state["songs"]["songs_list"][song_id]
+        song_id = self.engine.current_song
+
+        # the rest of the playlist downloads while the game is played
+        # so this song might not be ready yet
+        if not song.wait_until_ready(self.download_timeout):
+            print("Song still downloading, playing without it")
+
+        # open the clip while the user is guessing so it plays straight
+        # away, the next one too if it has already been downloaded
+        self.player.preload(song)
+
+        if song_id + 1 < len(self.songs_list) and self.songs_list[song_id + 1].is_ready():
+            self.player.preload(self.songs_list[song_id + 1])
+
+        # ready to check the guess before it's made
+        song.guess_matcher()
 
 
         print("=" * 25)
-        print(f"Song ID: { self.state['songs']['current_song'] }")
+        print(f"Song ID: { song_id }")
         print(f"Song Name: { song.name }")
         print(f"Song Artist: { song.artists }")
-        print(f"Attempts: { self.state['game']['attempts'] }")
-        print(f"Score: { self.state['game']['total_score'] }")
+        print(f"Attempts: { self.engine.attempts }")
+        print(f"Score: { self.engine.total_score }")
         print("=" * 25)
 
 
-        song_name = Label(text=blank_songname(song.name), font=self.font_guess, style="MusicGame.TLabel")
+        song_name = Label(text=song.blank_name, font=self.font_guess, style="MusicGame.TLabel")
         song_name.grid(row=0, column=0, columnspan=2)
 
         song_artist = Label(text=song.artists, font=self.font_default, style="MusicGame.TLabel")
@@ -355,14 +397,14 @@ class Application(Frame):
         guess_entry.focus()
         guess_entry.grid(row=3, columnspan=2, padx=Sizes.no_padding, pady=Sizes.no_padding, ipadx=Sizes.entry_padding, ipady=Sizes.entry_padding)
 
-        guess_command = lambda event: self.guess(song, guess_entry.get())
+        guess_command = lambda event: self.guess(guess_entry.get())
         self.root.bind("<Return>", guess_command)
 
         guess_button = Button(width=40, text="Make a guess:", command=lambda: guess_command(None), style="MusicGame.TButton", cursor=Cursor.hover)
         guess_button.grid(row=4, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
 
 
-    def correct_guess(self, song):
+    def correct_guess(self, song, clip_duriation):
         self.clear_screen(self.master)
 
         correct_text = Label(text="CORRECT", style="Correct.TLabel", font=self.font_title)
@@ -370,62 +412,46 @@ class Application(Frame):
 
         print(song.location)
 
-        if song.location is None:
-            duriation = self.screen_duriation / self.no_song_decrease_multiplier
-        else:
-            duriation = self.screen_duriation
-
-        self.player.play(song, duriation)
-
-        # prevent next screen for 'screen_duriation' seconds
-        delay = Timer(duriation, self.next_song)
-        delay.start()
+        # the engine moves on to the next song once it has played
+        self.player.play(song, clip_duriation)
     
-    def incorrect_guess(self, song):
+    def incorrect_guess(self, song, clip_duriation):
         self.clear_screen(self.master)
 
         incorrect_text = Label(text="INCORRECT", style="Incorrect.TLabel", font=self.font_title)
         incorrect_text.grid(row=0, column=0, columnspan=2, padx=Sizes.padding, pady=Sizes.padding * 5, ipadx=Sizes.padding * 2, ipady=Sizes.padding * 2)
 
-        attempts = self.state["game"]["attempts"]
+        # only played when it was the last guess
+        if clip_duriation is not None:
+            self.player.play(song, clip_duriation)
 
-        if song.location is None:
-            duriation = self.screen_duriation / self.no_song_decrease_multiplier
-        else:
-            duriation = self.screen_duriation
 
-        if attempts == 2: # replace with if was last guess
-            self.player.play(song, self.screen_duriation * 2)
-            delay = Timer(duriation, lambda: self.game_over("Incorrect.TLabel"))
-            delay.start()
-        else:
-            delay = Timer(duriation, self.play_page)
-            delay.start()
-
-
-    def game_over(self, text_style):
+    def game_over(self):
         self.clear_screen(self.master)
 
-        # Reset song counter
-        self.state["songs"]["current_song"] = None
+        if self.engine.completed:
+            print("Completed playlist")
+            text_style = "Correct.TLabel"
+        else:
+            text_style = "Incorrect.TLabel"
 
         game_over_text = Label(text="Game Over", style=text_style, font=self.font_title)
         game_over_text.grid(row=0, column=0, columnspan=2, padx=Sizes.padding, pady=Sizes.padding * 5, ipadx=Sizes.padding * 2, ipady=Sizes.padding * 2)
 
-        total_score = Label(text=f"Your overall score was: { self.state['game']['total_score'] }.", style="MusicGame.TLabel", font=self.font_default)
+        total_score = Label(text=f"Your overall score was: { self.engine.total_score }.", style="MusicGame.TLabel", font=self.font_default)
         total_score.grid(row=1, column=0, columnspan=2)
 
-        total_correct = Label(text=f"You had { self.state['game']['total_correct'] } correct guesses.", style="MusicGame.TLabel", font=self.font_default)
+        total_correct = Label(text=f"You had { self.engine.total_correct } correct guesses.", style="MusicGame.TLabel", font=self.font_default)
         total_correct.grid(row=2, column=0, columnspan=2)
 
-        total_incorrect = Label(text=f"You had { self.state['game']['total_incorrect'] } incorrect guesses.", style="MusicGame.TLabel", font=self.font_default)
+        total_incorrect = Label(text=f"You had { self.engine.total_incorrect } incorrect guesses.", style="MusicGame.TLabel", font=self.font_default)
         total_incorrect.grid(row=3, column=0, columnspan=2)
 
         main_menu_button = Button(text="Main Menu", style="MusicGame.TButton", command=self.main_page, state=DISABLED)
         main_menu_button.grid(row=4, column=0, columnspan=2, padx=Sizes.padding, pady=Sizes.padding)
 
         # Save result into database
-        save_result(self.state["user"]["id"], self.state["game"]["total_score"], self.state["game"]["total_correct"], self.state["game"]["total_incorrect"])
+        save_result(self.state["user"]["id"], self.engine.total_score, self.engine.total_correct, self.engine.total_incorrect)
 
         delay = Timer(self.screen_duriation, lambda: main_menu_button.config(state=NORMAL))
         delay.start()
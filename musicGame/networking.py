@@ -4,22 +4,619 @@
 #
 
 import base64
+import codecs
+import hashlib
 import json
 import os
+import random
+import re
+import shutil
+import subprocess
 import sys
+import threading
+import time
+import weakref
 
 import requests
 
+from contextlib import contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from multiprocessing import get_context
 from multiprocessing.pool import ThreadPool
+from queue import PriorityQueue, Empty
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+from musicGame.database import has_audio, store_audio, stored_audio_sizes, remove_audio, AUDIO_LOCATION_PREFIX, AUDIO_BLOBS_SUPPORTED
+from musicGame.database import get_asset_index, save_assets, remove_assets, least_recently_used_assets, Asset
+
+
+
+def convert_id3v23(file):
+	"""
+	By default, files downloaded from spotify use the id3v2.4 tag
+	format which doesn't work with playsound on windows (unsure
+	about Linux), so each clip is converted once when it's saved
+
+	Returns:
+		False if the file doesn't have a tag to convert
+	"""
+
+	from mutagen.id3 import ID3, ID3NoHeaderError
+
+	try:
+		audio_file = ID3(file)
+	except ID3NoHeaderError:
+		return False
+
+	if audio_file.version[:2] != (2, 3):
+		audio_file.save(v2_version=3)
+
+	return True
+
+
+def convert_clip_tags(path):
+	# a clip that can't be converted can still be played on most systems
+	try:
+		convert_id3v23(path)
+	except Exception as error:
+		print(f"Couldn't convert the tags of {path}: {error}")
+
+
+
+# Where clips are kept once they've been decoded
+DECODED_FOLDER = "assets/decoded/"
+
+
+def decoded_location(song_id):
+	return f"{DECODED_FOLDER}{song_id}.wav"
+
+
+def decode_clip(path, song_id, length):
+	"""
+	Decodes a clip into a wav file of raw 16 bit samples that is cut
+	to length seconds, so it can be played straight away without
+	being decoded every time
+
+	Returns:
+		False if ffmpeg isn't installed or the clip couldn't be decoded
+	"""
+
+	ffmpeg = shutil.which("ffmpeg")
+
+	if ffmpeg is None:
+		return False
+
+	location = decoded_location(song_id)
+	part_location = f"{location}.part"
+
+	result = subprocess.run([ffmpeg, "-v", "error", "-y", "-i", path, "-t", str(length), "-f", "wav", "-acodec", "pcm_s16le", part_location], capture_output=True)
+
+	if result.returncode != 0:
+		if os.path.exists(part_location):
+			os.remove(part_location)
+
+		return False
+
+	os.replace(part_location, location)
+	return True
+
+
+def remove_decoded(song_id):
+	location = decoded_location(song_id)
+
+	# on windows it can't be removed while the player has it open
+	try:
+		if os.path.exists(location):
+			os.remove(location)
+	except OSError as error:
+		print(f"Couldn't remove {location}: {error}")
+
+
+
+def read_json_items(chunks, convert=None, key="items"):
+	"""
+	Parses a json document a chunk at a time, each object in the array
+	called key is read and passed to convert as soon as all of it has
+	arrived, so neither the whole response or all of the raw items
+	have to be kept in memory
+
+	Args:
+		chunks: An iterator of bytes that make up the document
+		convert: Called with each item, what it returns is kept instead
+				 of the item, items it returns None for are left out
+		key: The name of the array to read the items from (Default: "items")
+
+	Returns:
+		the document with the converted items in the key array
+	"""
+
+	decoder = json.JSONDecoder()
+	text_decoder = codecs.getincrementaldecoder("utf-8")()
+	chunks = iter(chunks)
+	array_start = re.compile(rf'"{key}"\s*:\s*\[')
+
+	buffer = ""
+	position = 0
+	items = []
+
+	def read_more():
+		nonlocal buffer, position
+
+		chunk = next(chunks, None)
+
+		if chunk is None:
+			return False
+
+		# throw away the text that has already been read
+		buffer = buffer[position:] + text_decoder.decode(chunk)
+		position = 0
+		return True
+
+	# everything up to the start of the array is kept so the rest of
+	# the document can be read once the array is finished
+	match = array_start.search(buffer)
+
+	while match is None:
+		if not read_more():
+			return json.loads(buffer)
+
+		match = array_start.search(buffer)
+
+	head = buffer[:match.end()]
+	position = match.end()
+
+	while True:
+		while position < len(buffer) and buffer[position] in " \t\r\n,":
+			position += 1
+
+		if position == len(buffer):
+			if not read_more():
+				raise ValueError("json ended in the middle of an array")
+			continue
+
+		if buffer[position] == "]":
+			break
+
+		try:
+			item, position = decoder.raw_decode(buffer, position)
+		except json.JSONDecodeError:
+			# the item hasn't all arrived yet
+			if not read_more():
+				raise
+			continue
+
+		if convert is not None:
+			item = convert(item)
+
+		if item is not None:
+			items.append(item)
+
+	tail = buffer[position:] + "".join(text_decoder.decode(chunk) for chunk in chunks)
+
+	document = json.loads(head + tail)
+	set_json_items(document, key, items)
+
+	return document
+
+
+def set_json_items(document, key, items):
+	# puts the items back in the (now empty) array wherever it is
+	if isinstance(document, dict):
+		for name, value in document.items():
+			if name == key and value == []:
+				document[name] = items
+				return True
+
+			if set_json_items(value, key, items):
+				return True
+
+	return False
+
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+	"""
+	Raised instead of sending a request to a host which has failed too
+	many times in a row, it's a RequestException so anything that
+	already copes with the network being down copes with this too
+	"""
+
+
+
+class HostState:
+	"""
+	Keeps track of how a single host is behaving
+
+	The number of requests allowed to it at once is halved each time
+	it throttles us and slowly grows back as requests succeed. After
+	too many failures in a row the circuit opens and no requests are
+	sent until the cooldown has passed, then one request is let
+	through to see if it has recovered
+	"""
+
+	def __init__(self, max_concurrency, failure_threshold, cooldown):
+		self.max_concurrency = max_concurrency
+		self.concurrency = max_concurrency
+		self.in_flight = 0
+		self.successes = 0
+
+		self.failure_threshold = failure_threshold
+		self.cooldown = cooldown
+		self.failures = 0
+		self.open_until = 0
+		self.trial_running = False
+
+		self.condition = threading.Condition()
+
+	def acquire(self):
+		"""
+		Waits for a free slot to send a request to the host
+
+		Returns:
+			True if this is the trial request of a half open circuit,
+			which has to be given back to release
+
+		Raises:
+			CircuitOpenError if the host's circuit is open
+		"""
+
+		with self.condition:
+			trial = False
+
+			if self.failures >= self.failure_threshold:
+				if time.time() < self.open_until or self.trial_running:
+					raise CircuitOpenError("Too many failed requests, not trying again yet")
+
+				# half open, let this one request through to test the host
+				self.trial_running = True
+				trial = True
+
+			while self.in_flight >= self.concurrency:
+				self.condition.wait()
+
+			self.in_flight += 1
+
+			return trial
+
+	def release(self, trial=False):
+		with self.condition:
+			self.in_flight -= 1
+
+			# however the trial ended (even an error that isn't counted
+			# as a failure) another one can be let through after it
+			if trial:
+				self.trial_running = False
+
+			self.condition.notify()
+
+	def success(self):
+		with self.condition:
+			self.failures = 0
+			self.trial_running = False
+			self.successes += 1
+
+			# grow back by one for every few requests that go through
+			if self.concurrency < self.max_concurrency and self.successes >= self.concurrency:
+				self.concurrency += 1
+				self.successes = 0
+				self.condition.notify()
+
+	def failure(self):
+		with self.condition:
+			self.failures += 1
+			self.trial_running = False
+
+			if self.failures >= self.failure_threshold:
+				self.open_until = time.time() + self.cooldown
+
+	def throttled(self):
+		with self.condition:
+			self.concurrency = max(1, self.concurrency // 2)
+			self.successes = 0
+
+
+
+class RequestPolicy:
+	"""
+	Sends requests with retries for when a host is throttling us (429)
+	or having problems (5xx or connection errors). The Retry-After
+	header is used when we're throttled, otherwise it waits a random
+	time which doubles with each attempt so that all of the threads
+	don't retry at the same moment
+
+	Args:
+		max_concurrency: The most requests sent to one host at once (Default: 8)
+		retries: How many times a request is retried (Default: 4)
+		base_delay: The longest wait in seconds before the first retry (Default: 0.5)
+		max_delay: The longest wait in seconds before any retry (Default: 30)
+		failure_threshold: Failures in a row before a host's circuit opens (Default: 5)
+		cooldown: Seconds before a host with an open circuit is tried again (Default: 30)
+		timeout: Seconds to wait for a host to respond (Default: 10)
+	"""
+
+	def __init__(self, max_concurrency=8, retries=4, base_delay=0.5, max_delay=30, failure_threshold=5, cooldown=30, timeout=10):
+		self.max_concurrency = max_concurrency
+		self.retries = retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.failure_threshold = failure_threshold
+		self.cooldown = cooldown
+		self.timeout = timeout
+
+		self.hosts = {}
+		self.lock = threading.Lock()
+
+	def host_state(self, url):
+		host = urlparse(url).netloc
+
+		with self.lock:
+			if host not in self.hosts:
+				self.hosts[host] = HostState(self.max_concurrency, self.failure_threshold, self.cooldown)
+
+			return self.hosts[host]
+
+	def send(self, send_request, url, **kwargs):
+		"""
+		Sends a request using send_request (e.g. session.get) following
+		the policy
+
+		Returns:
+			the response, which is the last one received if it still
+			wasn't successful after all of the retries
+
+		Raises:
+			RequestException if the host couldn't be reached or its
+			circuit is open
+		"""
+
+		kwargs.setdefault("timeout", self.timeout)
+		host_state = self.host_state(url)
+
+		for attempt in range(self.retries + 1):
+			last_attempt = attempt == self.retries
+
+			trial = host_state.acquire()
+
+			try:
+				response = send_request(url, **kwargs)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+				host_state.failure()
+
+				if last_attempt:
+					raise error
+
+				delay = self.backoff(attempt)
+			else:
+				if response.status_code == 429:
+					host_state.throttled()
+					delay = self.retry_after(response)
+
+					if delay is None:
+						delay = self.backoff(attempt)
+				elif response.status_code >= 500:
+					host_state.failure()
+					delay = self.backoff(attempt)
+				else:
+					host_state.success()
+					return response
+
+				if last_attempt:
+					return response
+
+				response.close()
+			finally:
+				host_state.release(trial)
+
+			print(f"Retrying {url} in {delay:.1f}s")
+			time.sleep(delay)
+
+	def backoff(self, attempt):
+		return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+	def retry_after(self, response):
+		# can either be a number of seconds or a date
+		retry_after = response.headers.get("Retry-After")
+
+		if retry_after is None:
+			return None
+
+		try:
+			return min(float(retry_after), self.max_delay)
+		except ValueError:
+			pass
+
+		try:
+			retry_time = parsedate_to_datetime(retry_after).timestamp()
+			return min(max(retry_time - time.time(), 0), self.max_delay)
+		except (TypeError, ValueError):
+			return None
+
+
+
+class ConnectionPool:
+	"""
+	A shared keep-alive http session which both the Spotify and the
+	Downloader classes send their requests through so that each
+	request doesn't have to open a brand new TCP + TLS connection
+
+	Args:
+		size: The maximum number of connections kept open to a single
+			  host, this should match the number of downloader threads
+			  (Default: 8)
+
+		hosts: The number of different hosts to keep connection pools
+			   for (Default: 4)
+
+		policy: The RequestPolicy every request is sent with
+	"""
+
+	def __init__(self, size=8, hosts=4, policy=None):
+		self.size = size
+		self.hosts = hosts
+		self.lock = threading.Lock()
+		self.policy = policy if policy is not None else RequestPolicy(size)
+
+		self.session = requests.Session()
+		self.mount_adapter()
+
+	def mount_adapter(self):
+		# pool_block makes threads wait for a free connection instead of
+		# opening extra ones past the per host limit
+		self.adapter = HTTPAdapter(pool_connections=self.hosts, pool_maxsize=self.size, pool_block=True)
+		self.session.mount("https://", self.adapter)
+		self.session.mount("http://", self.adapter)
+
+	def resize(self, size):
+		# only ever grow the pool, so a smaller downloader doesn't starve
+		# a bigger one that is still using it
+		with self.lock:
+			if size > self.size:
+				self.size = size
+				self.mount_adapter()
+
+	def get(self, url, **kwargs):
+		return self.policy.send(self.session.get, url, **kwargs)
+
+	def post(self, url, **kwargs):
+		return self.policy.send(self.session.post, url, **kwargs)
+
+	def stats(self):
+		"""
+		Counts how many connections have been opened and how many
+		requests went over a connection that was already open
+
+		Returns:
+			a dictionary with the "opened", "reused" and "requests" counts
+		"""
+
+		opened = 0
+		requests_made = 0
+
+		with self.lock:
+			pools = self.adapter.poolmanager.pools
+			for key in pools.keys():
+				host_pool = pools[key]
+				opened += host_pool.num_connections
+				requests_made += host_pool.num_requests
+
+		return {
+			"opened": opened,
+			"reused": requests_made - opened,
+			"requests": requests_made
+		}
+
+
+# One pool shared by everything that talks to spotify
+http_pool = ConnectionPool()
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_ACCOUNTS_URL = "https://accounts.spotify.com/api"
+
+# Only the parts of a page of tracks that the game uses
+PAGE_FIELDS = "total,limit,offset,next,items(track(id,name,preview_url,album(artists(name))))"
+
+# Tracks picked for a sample which are at most this many places apart
+# are got in the same page request instead of one request each
+SAMPLE_MERGE_GAP = 10
+
+# How much of a json response is read at once while streaming it
+JSON_CHUNK_SIZE = 16 * 1024
+
+# How many seconds before a token expires that we get a new one
+TOKEN_REFRESH_MARGIN = 60
+
+# How many seconds before trying again when getting a new token failed
+TOKEN_RETRY_DELAY = 30
+
+# How much of a clip is held in memory at once while downloading
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# When at least this many saved clips still need their tags converting
+# they are converted by a pool of processes, converting one clip takes
+# less time than sending it to another process so new downloads are
+# always converted on their download thread
+TAG_POOL_MIN_SONGS = 50
+
+
+# Every song given to a Downloader that still exists (in a loaded
+# playlist or a game being played), their clips are never evicted.
+# Songs drop out of it by themselves once nothing uses them
+songs_in_use = weakref.WeakSet()
+songs_in_use_lock = threading.Lock()
+
+
+# The clips being downloaded by every Downloader, song id to a lock and
+# how many downloads are waiting on it
+downloads_in_flight = {}
+downloads_in_flight_lock = threading.Lock()
+
+
+@contextmanager
+def claim_download(song_id):
+	with downloads_in_flight_lock:
+		claim = downloads_in_flight.setdefault(song_id, [threading.Lock(), 0])
+		claim[1] += 1
+
+	try:
+		with claim[0]:
+			yield
+	finally:
+		with downloads_in_flight_lock:
+			claim[1] -= 1
+
+			if claim[1] == 0:
+				del downloads_in_flight[song_id]
+
+
+def use_songs(song_list):
+	with songs_in_use_lock:
+		songs_in_use.update(song_list)
+
+
+def song_ids_in_use():
+	with songs_in_use_lock:
+		return {song.id for song in songs_in_use}
+
+
+def remove_clips(song_ids):
+	"""
+	Deletes the clips of songs wherever they are kept, their file in
+	the assets folder, their decoded wav and their audio in the
+	database, and takes them out of the asset index
+	"""
+
+	for song_id in song_ids:
+		path = f"assets/{song_id}.mp3"
+
+		if os.path.exists(path):
+			os.remove(path)
+
+		remove_decoded(song_id)
+
+	remove_audio(song_ids)
+	remove_assets(song_ids)
 
 
 
 class Spotify:
-	def __init__(self):
+	def __init__(self, pool=http_pool):
+		self.pool = pool
 		self.authenticated = False
 		self.client_id = ""
 		self.client_secret = ""
+		self.audio_storage = "files"
+		self.asset_budget = 500
+		self.decode_clips = False
+		self.sample_size = None
+		self.playlists = {}
+		self.api_url = SPOTIFY_API_URL
+		self.accounts_url = SPOTIFY_ACCOUNTS_URL
 		self.token = None
+		self.token_expires = 0
+		self.token_lock = threading.RLock()
+		self.refresh_timer = None
 		
 		# Call this when the class is initialised so we are already
 		# authenticated with the api before we need to use it!
@@ -35,149 +632,404 @@ class Spotify:
 			try:
 				self.client_id = config_data["client_id"]
 				self.client_secret = config_data["client_secret"]
+
+				# "files" or "database", where the downloaded clips are kept
+				self.audio_storage = config_data.get("audio_storage", "files")
+
+				# how many megabytes the clips can use, in the assets folder and the database
+				self.asset_budget = config_data.get("asset_budget", 500)
+
+				# whether clips are decoded ahead of time, needs ffmpeg
+				self.decode_clips = config_data.get("decode_clips", False)
+
+				# how many songs a game picks at random, every song in
+				# order if it isn't set
+				self.sample_size = config_data.get("sample_size")
+
+				# more playlists to choose from, ids to the names shown
+				self.playlists = config_data.get("playlists", {})
+
+				# can be pointed at a stand in server for testing
+				self.api_url = config_data.get("api_url", SPOTIFY_API_URL)
+				self.accounts_url = config_data.get("accounts_url", SPOTIFY_ACCOUNTS_URL)
 			except KeyError as error:
 				print("Config file bad, please fix")
 				sys.exit(1)
 
-	def authenticate(self):
-		if not self.authenticated:
-			
-			got_token = False
-
-			# check if we have already got a valid token saved
-			if os.path.exists("token.txt"):
-				token = None
-				with open("token.txt") as token_file:
-					token = token_file.read()
-					token_file.close()
-				
-				if token is not None:
-					# if the token exists, try to request the root url of
-					#  spotify api with it
+	def authenticate(self, force=False):
+		"""
+		Gets a token to use with the api. A saved token is used straight
+		away without asking spotify if it's still valid as we know when
+		it expires, a new one is only requested when the saved one has
+		expired (or is about to) or force is True
+		"""
+
+		with self.token_lock:
+			if force or not self.authenticated:
+				got_token = False
+
+				# check if we have already got a valid token saved
+				if not force and self.load_token():
+					print("Valid Token :)")
+					self.authenticated = True
+					got_token = True
+
+				if not got_token:
+					# Encode the id and the secret
+					auth_string = f"{self.client_id}:{self.client_secret}"
+					auth_encoded = base64.b64encode(auth_string.encode()).decode()
+					
+					# Authenticate with spotify
+					request_url = f"{self.accounts_url}/token/"
 					request_headers = {
-						"Authorization": f"Bearer {token}"
+						"Authorization": f"Basic {auth_encoded}"
+					}
+
+					request_data = {
+						"grant_type": "client_credentials"
 					}
 
 					try:
-						test_token = requests.get("https://api.spotify.com/v1", headers=request_headers)
-					except requests.exceptions.RequestException as error:
-						print("Check authentication error")
+						request_token = self.pool.post(request_url, headers=request_headers, data=request_data)
+
+						# an error page (like the service being down) isn't a token
+						request_token.raise_for_status()
+						request_result = json.loads(request_token.text)
+					except (requests.exceptions.RequestException, ValueError) as error:
+						# stay unauthenticated so the game can carry on
+						# offline with the playlists saved in the database
+						print("Authentication requests error, playing offline")
 						print(error)
-						sys.exit()
+
+						# a background refresh tries again while the
+						# token it has is still being used
+						if self.authenticated:
+							self.schedule_refresh(TOKEN_RETRY_DELAY)
+
+						return
 					
-					token_test_response = json.loads(test_token.text)
+					# Save access token recieved in class and set authenticated
 
-					# if the api responds with a 400 error, its a valid token
-					if token_test_response["error"]["status"] == 400:
-						print("Valid Token :)")
-						self.token = token
+					try:
+						self.token = request_result["access_token"]
+						self.token_expires = time.time() + request_result.get("expires_in", 3600)
 						self.authenticated = True
-						got_token = True
-					# if the server responds with a 401 error, its not valid
-					elif token_test_response["error"]["status"] == 401:
-						print("Invalid Token :(")
-					# your screwed if you hit this
-					else:
-						print("Unknown response ¯\_(ツ)_/¯")
-
-			if not got_token:
-				# Encode the id and the secret
-				auth_string = f"{self.client_id}:{self.client_secret}"
-				auth_encoded = base64.b64encode(auth_string.encode()).decode()
-				
-				# Authenticate with spotify
-				request_url = "https://accounts.spotify.com/api/token/"
-				request_headers = {
-					"Authorization": f"Basic {auth_encoded}"
-				}
-
-				request_data = {
-					"grant_type": "client_credentials"
-				}
 
-				try:
-					request_token = requests.post(request_url, headers=request_headers, data=request_data)
-				except requests.exceptions.RequestException as error:
-					print("Authentication requests error")
-					print(error)
-					sys.exit()
-				
-				# Save access token recieved in class and set authenticated
-				request_result = json.loads(request_token.text)
+						# save the token in a file so that we don't have to
+						# reauthenticate next time if it hasn't expired
+						self.save_token()
+						
+					except KeyError as error:
+						print("Error In Authentication", error)
+						self.authenticated = False
 
+				if self.authenticated:
+					self.schedule_refresh()
+
+	def load_token(self):
+		# token.txt holds the token and the time it expires, older
+		# files with just the token in are ignored
+		if os.path.exists("token.txt"):
+			with open("token.txt") as token_file:
 				try:
-					self.token = request_result["access_token"]
-					self.authenticated = True
+					saved_token = json.loads(token_file.read())
+				except json.JSONDecodeError:
+					return False
 
-					# save the token in a file so that we might not
-					# have to reauthenticate if the token is still valid
-					with open("token.txt", "w") as token_file:
-						token_file.write(self.token)
-						token_file.close()
-					
-				except KeyError as error:
-					print("Error In Authentication", error)
-					self.authenticated = False
+			try:
+				token = saved_token["access_token"]
+				expires = saved_token["expires_at"]
+			except (KeyError, TypeError):
+				return False
 
-	def get_playlist(self, playlist_id):
-		# it's quite obvious what this function does
+			if expires - TOKEN_REFRESH_MARGIN > time.time():
+				self.token = token
+				self.token_expires = expires
+				return True
 
-		if self.authenticated:
-			playlist_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/"
-			print(f"Requesting {playlist_url}")
-			request_headers = {
-				"Authorization": f"Bearer {self.token}"
-			}
+		return False
+
+	def save_token(self):
+		saved_token = {
+			"access_token": self.token,
+			"expires_at": self.token_expires
+		}
+
+		with open("token.txt", "w") as token_file:
+			token_file.write(json.dumps(saved_token))
+			token_file.close()
+
+	def schedule_refresh(self, refresh_in=None):
+		# get a new token in the background just before this one
+		# runs out so requests never have to wait for one
+		if self.refresh_timer is not None:
+			self.refresh_timer.cancel()
+
+		if refresh_in is None:
+			refresh_in = max(self.token_expires - TOKEN_REFRESH_MARGIN - time.time(), 0)
+
+		self.refresh_timer = threading.Timer(refresh_in, self.authenticate, kwargs={"force": True})
+		self.refresh_timer.daemon = True
+		self.refresh_timer.start()
 
+	def api_get(self, url, **kwargs):
+		"""
+		Sends a get request to the api with the current token, if
+		spotify says the token isn't valid anymore we get a new one
+		and try again once
+
+		Responses that aren't used are closed so a streamed one doesn't
+		keep its connection out of the pool
+
+		Raises:
+			RequestException if the request failed or spotify still
+			responded with an error after the retries
+		"""
+
+		used_token = self.token
+		response = self.pool.get(url, headers=self.auth_headers(), **kwargs)
+
+		if response.status_code == 401:
+			print("Invalid Token :(")
+			response.close()
+
+			with self.token_lock:
+				# another thread may have already got a new one
+				if self.token == used_token:
+					self.authenticate(force=True)
+
+			response = self.pool.get(url, headers=self.auth_headers(), **kwargs)
+
+		# don't try to read an error (like being throttled) as a result
+		try:
+			response.raise_for_status()
+		except requests.exceptions.HTTPError:
+			response.close()
+			raise
+
+		return response
+
+	def get_playlist(self, playlist_id, workers=4, convert=None):
+		"""
+		Gets a whole playlist, the first request tells us how many
+		tracks there are so the rest of the pages are all requested
+		at the same time and then put back in order
+
+		Only the fields of each track that the game uses are requested
+		and each track is read out of the response as it arrives
+
+		Args:
+			playlist_id: The spotify id of the playlist
+			workers: The maximum number of pages requested at once (Default: 4)
+			convert: Called with each track item as soon as it's read, what
+					 it returns is kept instead of the item (Default: None)
+
+		Returns:
+			the playlist dictionary with every track in tracks.items or
+			False if we aren't authenticated or it couldn't be got
+		"""
+
+		if self.authenticated:
 			try:
-				request_playlist = requests.get(playlist_url, headers=request_headers)
-			except requests.exceptions.RequestException as error:
+				request_playlist_result = self.request_playlist(playlist_id, convert)
+
+				track_list = request_playlist_result["tracks"]["items"]
+				pages = dict(self.get_remaining_pages(playlist_id, request_playlist_result["tracks"], workers, convert))
+			except (requests.exceptions.RequestException, ValueError) as error:
+				# a ValueError is a response that was cut off or isn't json
 				print("Playlist request error")
 				print(error)
-				sys.exit()
-			
-			request_playlist_result = json.loads(request_playlist.text)
+				return False
 
-			total_tracks = request_playlist_result["tracks"]["total"]
-			limit = 100
+			for offset in sorted(pages):
+				track_list += pages[offset]
 
-			if total_tracks > limit:
-				# only do a multiple requests to get all songs if we don't
-				# already have them all as that would be a big waste
+			request_playlist_result["tracks"]["items"] = track_list
+			request_playlist_result["tracks"]["next"] = None
 
-				# add tracks to existing list
-				track_list = request_playlist_result["tracks"]["items"]
+			return request_playlist_result
+		else:
+			return False
 
-				is_more = True
-				previous_request = request_playlist_result
+	def get_playlist_pages(self, playlist_id, workers=4, convert=None):
+		"""
+		Same as get_playlist but yields each page of tracks as soon as it
+		arrives so the caller can start on them before the last page is
+		back. Pages after the first can arrive in any order
 
-				while is_more:
-					next_url = previous_request["tracks"]["next"]
-					print(f"Requesting {next_url}")
+		Yields:
+			(offset, items) tuples where offset is the playlist position
+			of the first track in items
 
-					try:
-						next_request = requests.get(next_url, headers=request_headers)
-					except requests.exceptions.RequestException as error:
-						print("Playlist request error")
-						print(error)
-						sys.exit()
-					
-					next_request_result = {}
-					next_request_result["tracks"] = json.loads(next_request.text)
+		Raises:
+			RequestException if a page couldn't be got
+		"""
+
+		if self.authenticated:
+			request_playlist_result = self.request_playlist(playlist_id, convert)
+			tracks = request_playlist_result["tracks"]
 
-					track_list += next_request_result["tracks"]["items"]
+			yield (tracks.get("offset", 0), tracks["items"])
+			yield from self.get_remaining_pages(playlist_id, tracks, workers, convert)
 
-					if next_request_result["tracks"]["next"] == None:
-						is_more = False
-					else:
-						previous_request = next_request_result
-				
-				request_playlist_result["tracks"]["items"] = track_list
+	def get_playlist_sample(self, playlist_id, count, workers=4, convert=None):
+		"""
+		Gets tracks picked at random from a playlist without getting the
+		whole thing, the total number of tracks is asked for first and
+		then only the pages around the picked positions are requested
 
-			return request_playlist_result
-		else:
+		If some of the picked tracks aren't availible (convert returned
+		None for them) more are picked until there are enough or the
+		playlist has run out
+
+		Args:
+			playlist_id: The spotify id of the playlist
+			count: How many tracks to pick
+			workers: The maximum number of pages requested at once (Default: 4)
+			convert: Called with each picked track item, what it returns
+					 is kept instead of the item (Default: None)
+
+		Returns:
+			a list of at most count tracks in a random order or False
+			if we aren't authenticated or they couldn't be got
+		"""
+
+		if not self.authenticated:
+			return False
+
+		page_url = f"{self.api_url}/playlists/{playlist_id}/tracks"
+		track_list = []
+		tried = set()
+
+		try:
+			request_total = self.api_get(page_url, params={"limit": 1, "fields": "total"})
+			total_tracks = json.loads(request_total.text)["total"]
+
+			while len(track_list) < count and len(tried) < total_tracks:
+				wanted = count - len(track_list)
+
+				# picking enough that at least the number wanted haven't been tried
+				picked = random.sample(range(total_tracks), min(total_tracks, wanted + len(tried)))
+				positions = [position for position in picked if position not in tried][:wanted]
+				tried.update(positions)
+
+				items = self.get_sample_items(page_url, positions, workers)
+
+				for position in positions:
+					# missing if the playlist got shorter since the total was got
+					item = items.get(position)
+
+					if item is not None and convert is not None:
+						item = convert(item)
+
+					if item is not None:
+						track_list.append(item)
+		except (requests.exceptions.RequestException, ValueError) as error:
+			# a ValueError is a response that was cut off or isn't json
+			print("Playlist sample request error")
+			print(error)
 			return False
 
+		return track_list
+
+	def get_sample_items(self, page_url, positions, workers):
+		# positions close together share a page, pages are capped at
+		# the 100 tracks spotify gives at once
+		pages = []
+
+		for position in sorted(positions):
+			if pages and position - pages[-1][1] <= SAMPLE_MERGE_GAP and position - pages[-1][0] < 100:
+				pages[-1][1] = position
+			else:
+				pages.append([position, position])
+
+		pool = ThreadPool(min(workers, len(pages)))
+
+		try:
+			# items are left unconverted so they line up with their positions
+			requested = pool.imap_unordered(lambda page: self.request_page(page_url, page[0], page[1] - page[0] + 1), pages)
+
+			return {offset + index: item for offset, items in requested for index, item in enumerate(items)}
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def get_playlist_snapshot(self, playlist_id):
+		"""
+		Asks spotify for just the snapshot id of a playlist, which
+		changes whenever the playlist does, so we can cheaply check if
+		a saved playlist needs updating
+
+		Returns:
+			the snapshot id or None if it couldn't be got
+		"""
+
+		if self.authenticated:
+			playlist_url = f"{self.api_url}/playlists/{playlist_id}/"
+			request_params = {
+				"fields": "snapshot_id"
+			}
+
+			try:
+				request_snapshot = self.api_get(playlist_url, params=request_params)
+				return json.loads(request_snapshot.text).get("snapshot_id")
+			except (requests.exceptions.RequestException, ValueError) as error:
+				print("Playlist snapshot request error")
+				print(error)
+				return None
+
+		return None
+
+	def request_playlist(self, playlist_id, convert=None):
+		playlist_url = f"{self.api_url}/playlists/{playlist_id}/"
+		print(f"Requesting {playlist_url}")
+		request_params = {
+			"fields": f"snapshot_id,tracks({PAGE_FIELDS})"
+		}
+
+		with self.api_get(playlist_url, params=request_params, stream=True) as request_playlist:
+			return read_json_items(request_playlist.iter_content(JSON_CHUNK_SIZE), convert)
+
+	def request_page(self, page_url, offset, limit, convert=None):
+		# runs inside the page pool so errors are left for the
+		# caller to deal with
+		print(f"Requesting {page_url} (offset {offset})")
+		request_params = {
+			"offset": offset,
+			"limit": limit,
+			"fields": PAGE_FIELDS
+		}
+
+		with self.api_get(page_url, params=request_params, stream=True) as request_page:
+			return (offset, read_json_items(request_page.iter_content(JSON_CHUNK_SIZE), convert)["items"])
+
+	def get_remaining_pages(self, playlist_id, first_page, workers, convert=None):
+		# work out every offset left from the total and the page size
+		# instead of following each "next" url one after the other
+		total_tracks = first_page["total"]
+		limit = first_page.get("limit") or 100
+		offsets = range(first_page.get("offset", 0) + limit, total_tracks, limit)
+
+		if len(offsets) == 0:
+			return
+
+		page_url = f"{self.api_url}/playlists/{playlist_id}/tracks"
+		pool = ThreadPool(min(workers, len(offsets)))
+
+		try:
+			pages = pool.imap_unordered(lambda offset: self.request_page(page_url, offset, limit, convert), offsets)
+
+			for page in pages:
+				yield page
+		finally:
+			pool.terminate()
+			pool.join()
+
+	def auth_headers(self):
+		return {
+			"Authorization": f"Bearer {self.token}"
+		}
+
 
 
 class Downloader:
@@ -185,9 +1037,34 @@ class Downloader:
 	Class to handle downloading the 30 second audio clips that the
 	spotify api returns
 
+	Clips saved as files are kept track of in the asset index so the
+	assets folder doesn't need searching for each song, a clip is only
+	checked against the index when one of its songs is downloaded and
+	once the downloads are done the least recently used clips are
+	deleted if the folder is bigger than the budget
+
 	Args:
 		threads: The number of threads that the downloader should 
 				 use (Default: 8)
+
+		pool: The ConnectionPool to download through, it gets resized
+			  so each thread can keep its own connection open
+
+		storage: "files" to save clips in the assets folder or "database"
+				 to save them as blobs in the database (Default: "files")
+
+		playlist_id: The playlist the songs being downloaded are from
+
+		budget: How many megabytes the assets folder can use (Default: 500)
+
+		decode_length: If given, each clip is also decoded into a wav file
+					   this many seconds long so it can be played without
+					   decoding it, this needs ffmpeg (Default: None)
+
+		Every clip has its id3 tag converted once as it's saved, clips
+		saved before this was done are converted in one batch before the
+		downloads start, shared between a pool of processes if there
+		are enough of them
 		
 		url_list: a list of Song Objects which should contain a URL
 				  variable which will be downloaded and saved using
@@ -198,48 +1075,504 @@ class Downloader:
 		a location variable where the mp3 was downloaded to
 	"""
 
-	def __init__(self, threads=8):
+	def __init__(self, threads=8, pool=http_pool, storage="files", playlist_id=None, budget=500, decode_length=None):
 		self.threads = threads
+		self.pool = pool
+		self.pool.resize(threads)
+		self.storage = storage
+		self.playlist_id = playlist_id
+		self.budget = budget * 1024 * 1024
+		self.decode_length = decode_length
+		self.worker_lock = threading.Lock()
+
+		self.asset_index = {}
+		self.new_assets = []
+		self.checked_assets = []
+		self.broken_assets = []
+
+		if self.storage == "database" and not AUDIO_BLOBS_SUPPORTED:
+			print("Storing audio in the database needs python 3.11, using files instead")
+			self.storage = "files"
+
 		print("Starting downloader")
 	
 	def start(self, url_list):
+		if len(url_list) == 0:
+			return []
+
+		use_songs(url_list)
+		self.prepare(url_list)
+
 		# create a thread pool using x amount of threads
 		pool = ThreadPool(self.threads)
 		song_list, downloaded = zip(*pool.map(self.download, url_list))
 
-		print(f"Downloaded {downloaded.count(True)} new Files")
+		# terminate the thread once work has been done
+		pool.close()
+		pool.join()
 
+		self.finish(song_list, downloaded.count(True))
+
+		return song_list
+
+	def start_background(self, song_list, wait_for=3):
+		"""
+		Downloads the songs in the order they will be played on
+		background threads and only waits for the first few of them,
+		so the game can start while the rest are still downloading.
+		Each song is marked ready once it has been dealt with
+
+		Args:
+			song_list: the songs in the order they will be played
+			wait_for: how many songs from the start of the list to
+					  wait for before returning (Default: 3)
+		"""
+
+		if len(song_list) == 0:
+			return song_list
+
+		use_songs(song_list)
+		self.prepare(song_list)
+
+		# the lowest play position is always downloaded next
+		download_queue = PriorityQueue()
+
+		for position, song in enumerate(song_list):
+			song.mark_downloading()
+			download_queue.put((position, song))
+
+		worker_count = min(self.threads, len(song_list))
+		self.workers_left = worker_count
+		self.downloaded_count = 0
+
+		for number in range(worker_count):
+			worker = threading.Thread(target=self.download_worker, name="Downloader", args=(download_queue, song_list))
+			worker.daemon = True
+			worker.start()
+
+		for song in song_list[:wait_for]:
+			song.wait_until_ready()
+
+		return song_list
+
+	def download_worker(self, download_queue, song_list):
+		while True:
+			try:
+				position, song = download_queue.get_nowait()
+			except Empty:
+				break
+
+			try:
+				song, downloaded = self.download(song)
+
+				if downloaded:
+					with self.worker_lock:
+						self.downloaded_count += 1
+			finally:
+				song.mark_ready()
+
+		with self.worker_lock:
+			self.workers_left -= 1
+			finished = self.workers_left == 0
+
+		if finished:
+			self.finish(song_list, self.downloaded_count)
+
+	def prepare(self, song_list):
 		# Check if assets folder exists, if not, create it
 		if not os.path.exists("assets/"):
 			os.makedirs("assets/")
 
-		# terminate the thread once work has been done
-		pool.close()
-		pool.join()
+		if self.decode_length is not None:
+			if shutil.which("ffmpeg") is None:
+				print("Decoding clips needs ffmpeg, playing them as they are")
+				self.decode_length = None
+			elif not os.path.exists(DECODED_FOLDER):
+				os.makedirs(DECODED_FOLDER)
 
-		return song_list
+		# one query instead of checking for every file, clips kept in
+		# the database are in it too if they have been decoded
+		self.asset_index = get_asset_index()
+		self.new_assets = []
+		self.checked_assets = []
+		self.broken_assets = []
+
+		if self.storage == "files":
+			self.convert_saved(song_list)
+		else:
+			self.index_stored()
+
+	def convert_saved(self, song_list):
+		"""
+		Converts the tags of every clip in song_list which was saved
+		before they were converted, in one batch, and adds them to the
+		index. Clips in the database are downloaded again instead
+		"""
+
+		unconverted = []
+
+		for song in song_list:
+			if song.url is None:
+				continue
+
+			path = f"assets/{song.id}.mp3"
+			asset = self.asset_index.get(song.id)
+
+			if (asset is None or not asset.tags_converted) and os.path.exists(path):
+				unconverted.append((song, path))
+
+		if len(unconverted) == 0:
+			return
+
+		paths = [path for song, path in unconverted]
+		print(f"Converting the tags of {len(paths)} saved clips")
+
+		if len(paths) >= TAG_POOL_MIN_SONGS:
+			# spawned rather than forked as the game already has threads running
+			with get_context("spawn").Pool(min(self.threads, os.cpu_count() or 1)) as tag_pool:
+				tag_pool.map(convert_clip_tags, paths, chunksize=max(len(paths) // (self.threads * 4), 1))
+		else:
+			for path in paths:
+				convert_clip_tags(path)
+
+		for song, path in unconverted:
+			self.add_asset(song, path)
+
+	def index_stored(self):
+		# audio stored before it was counted in the index is added to
+		# it, so it counts towards the budget and can be evicted
+		for song_id, size in stored_audio_sizes().items():
+			asset = self.asset_index.get(song_id)
+
+			if asset is None:
+				self.add_stored(song_id, size)
+			elif asset.size != size:
+				asset.size = size
+				self.checked_assets.append(asset)
+
+	def finish(self, song_list, downloaded_count):
+		print(f"Downloaded {downloaded_count} new Files")
+
+		connections = self.pool.stats()
+		print(f"Connections opened: {connections['opened']}, reused: {connections['reused']}")
+
+		# broken clips that were downloaded again are added back
+		if len(self.broken_assets) > 0:
+			remove_assets(self.broken_assets)
+
+		song_ids = [song.id for song in song_list if song.location is not None]
+		save_assets(self.new_assets + self.checked_assets, self.playlist_id, song_ids)
+
+		self.evict_assets(song_ids)
 	
 	def download(self, song):
+		# another Downloader could be getting the same clip (when a
+		# playlist is chosen while the last is still downloading), this
+		# one waits and then finds it already saved
+		with claim_download(song.id):
+			if self.storage == "database":
+				return self.download_to_database(song)
+
+			return self.download_to_file(song)
+
+	def download_to_file(self, song):
 		url = song.url
 		downloaded = False
 
 		if url is not None:
 			path = f"assets/{song.id}.mp3"
-			song.location = path
+			asset = self.asset_index.get(song.id)
 
-			# Only download if the file doesn't already exist
-			if not os.path.exists(path):
-				downloaded = True
+			# a clip saved by another Downloader after this one got its
+			# index is picked up by the check for files without an asset
+			if asset is not None and not self.asset_intact(asset, path):
+				self.remove_broken_asset(song.id, path)
+				asset = None
+
+			already_saved = asset is not None
+
+			if (not already_saved and os.path.exists(path)) or (already_saved and not asset.tags_converted):
+				# saved before there was an index or before tags were converted
+				convert_clip_tags(path)
+				self.add_asset(song, path)
+				already_saved = True
 
+			# Only download if the file doesn't already exist
+			if not already_saved:
 				try:
-					file_data = requests.get(url).content
+					downloaded = self.download_file(url, path)
 				except requests.exceptions.RequestException as error:
+					# the song can still be guessed without its clip
+					# so don't stop the game (we might just be offline)
 					print("Download file error")
 					print(error)
-					sys.exit()
-				
-				with open(path, "wb") as data_file:
-					data_file.write(file_data)
-					data_file.close()
+
+				if downloaded:
+					convert_clip_tags(path)
+					self.add_asset(song, path)
+
+			if already_saved or downloaded:
+				self.decode(song, path)
+
+			# only point the song at the file once it's all there as
+			# the game might already be playing
+			song.location = path if already_saved or downloaded else None
 		
 		return (song, downloaded)
+
+	def decode(self, song, path):
+		if self.decode_length is None:
+			return
+
+		location = decoded_location(song.id)
+
+		if not os.path.exists(location) and not decode_clip(path, song.id, self.decode_length):
+			print(f"Couldn't decode {path}")
+			return
+
+		self.add_decoded(song, os.path.getsize(location))
+
+	def add_decoded(self, song, decoded_size):
+		# decoded clips are several times bigger than the mp3s so they
+		# are counted in the budget along with them
+		with self.worker_lock:
+			asset = self.asset_index.get(song.id)
+
+			if asset is None:
+				# only the decoded wav of a clip kept in the database
+				asset = Asset(song_id=song.id, size=0, downloaded=datetime.now(), playlist_id=self.playlist_id, tags_converted=True)
+				self.asset_index[song.id] = asset
+				self.new_assets.append(asset)
+			elif asset.decoded_size == decoded_size:
+				return
+			else:
+				self.checked_assets.append(asset)
+
+			asset.decoded_size = decoded_size
+
+	def add_stored(self, song_id, size):
+		with self.worker_lock:
+			asset = self.asset_index.get(song_id)
+
+			if asset is None:
+				asset = Asset(song_id=song_id, size=size, downloaded=datetime.now(), playlist_id=self.playlist_id, tags_converted=True)
+				self.asset_index[song_id] = asset
+				self.new_assets.append(asset)
+			else:
+				asset.size = size
+				self.checked_assets.append(asset)
+
+	def add_asset(self, song, path):
+		file_stat = os.stat(path)
+		asset = Asset(song_id=song.id, size=file_stat.st_size, hash=self.file_hash(path), downloaded=datetime.now(), playlist_id=self.playlist_id, tags_converted=True, modified=file_stat.st_mtime)
+
+		with self.worker_lock:
+			self.asset_index[song.id] = asset
+			self.new_assets.append(asset)
+
+	def file_hash(self, path):
+		file_hash = hashlib.sha1()
+
+		with open(path, "rb") as asset_file:
+			for chunk in iter(lambda: asset_file.read(DOWNLOAD_CHUNK_SIZE), b""):
+				file_hash.update(chunk)
+
+		return file_hash.hexdigest()
+
+	def asset_intact(self, asset, path):
+		"""
+		Checks a clip in the index is still there and hasn't been
+		changed, it's only hashed if its modified time is different to
+		when it was last hashed
+
+		Returns:
+			False if the clip is missing or corrupt
+		"""
+
+		try:
+			file_stat = os.stat(path)
+		except FileNotFoundError:
+			return False
+
+		if file_stat.st_size != asset.size:
+			return False
+
+		if asset.modified == file_stat.st_mtime:
+			return True
+
+		if self.file_hash(path) != asset.hash:
+			return False
+
+		asset.modified = file_stat.st_mtime
+
+		with self.worker_lock:
+			self.checked_assets.append(asset)
+
+		return True
+
+	def remove_broken_asset(self, song_id, path):
+		# deleted and taken out of the index so it's downloaded again
+		print(f"Asset {path} is missing or corrupt")
+
+		if os.path.exists(path):
+			os.remove(path)
+
+		remove_decoded(song_id)
+
+		with self.worker_lock:
+			del self.asset_index[song_id]
+			self.broken_assets.append(song_id)
+
+	def evict_assets(self, keep_ids):
+		"""
+		Deletes the least recently used clips until the ones in the
+		assets folder and the database are under budget, clips in
+		keep_ids or of any song still in use are never deleted
+		"""
+
+		assets = least_recently_used_assets()
+		total_size = sum(asset.size + (asset.decoded_size or 0) for asset in assets)
+
+		if total_size <= self.budget:
+			return
+
+		keep_ids = set(keep_ids) | song_ids_in_use()
+		evicted = []
+
+		for asset in assets:
+			if total_size <= self.budget:
+				break
+
+			if asset.song_id not in keep_ids:
+				total_size -= asset.size + (asset.decoded_size or 0)
+				evicted.append(asset.song_id)
+
+		if len(evicted) > 0:
+			remove_clips(evicted)
+			print(f"Removed {len(evicted)} old clips, assets now uses {total_size / 1024 / 1024:.1f} MB")
+
+	def download_to_database(self, song):
+		url = song.url
+		downloaded = False
+
+		if url is not None:
+			# clips stored before their tags were converted are downloaded again
+			already_saved = has_audio(song.id, tags_converted=True)
+
+			if not already_saved:
+				# the clip is streamed to a part file first so it gets the
+				# same resume and size checks, then copied into the database
+				path = f"assets/{song.id}.download"
+
+				try:
+					downloaded = self.download_file(url, path)
+				except requests.exceptions.RequestException as error:
+					print("Download file error")
+					print(error)
+
+				if downloaded:
+					convert_clip_tags(path)
+					store_audio(song.id, path, tags_converted=True)
+					self.add_stored(song.id, os.path.getsize(path))
+					self.decode(song, path)
+					os.remove(path)
+
+			song.location = f"{AUDIO_LOCATION_PREFIX}{song.id}" if already_saved or downloaded else None
+
+		return (song, downloaded)
+
+	def download_file(self, url, path):
+		"""
+		Streams the file at url into a .part file in chunks and only
+		renames it to path once all of it has arrived, so a half
+		downloaded file is never mistaken for a finished one. If a .part
+		file was left behind by a previous run the download carries on
+		from the end of it
+
+		Returns:
+			True if path now holds the complete file, otherwise False
+		"""
+
+		part_path = f"{path}.part"
+		resume_from = 0
+		request_headers = {}
+
+		if os.path.exists(part_path):
+			resume_from = os.path.getsize(part_path)
+			request_headers["Range"] = f"bytes={resume_from}-"
+
+		with self.pool.get(url, headers=request_headers, stream=True) as response:
+			# the server doesn't like our range (416) or sent a different
+			# bit of the file to the one we asked for, either way the
+			# part file can't be trusted
+			restart = resume_from > 0 and (response.status_code == 416 or (response.status_code == 206 and self.range_start(response) != resume_from))
+
+			if not restart:
+				written, expected_size = self.write_part(response, url, part_path)
+
+		if restart:
+			# start again from nothing, once this response is closed so
+			# it isn't holding one of the pool's connections
+			os.remove(part_path)
+			return self.download_file(url, path)
+
+		if not written:
+			return False
+
+		file_size = os.path.getsize(part_path)
+
+		if expected_size is not None and file_size != expected_size:
+			print(f"Download size mismatch for {path}: got {file_size} expected {expected_size}")
+
+			# too big means it's corrupt, too small can be resumed later
+			if file_size > expected_size:
+				os.remove(part_path)
+
+			return False
+
+		os.replace(part_path, path)
+		return True
+
+	def write_part(self, response, url, part_path):
+		"""
+		Writes the body of a download's response to its part file
+
+		Returns:
+			whether anything could be written and the size the part
+			file should end up, if the response says
+		"""
+
+		expected_size = None
+		compressed = "Content-Encoding" in response.headers
+
+		if response.status_code == 206:
+			write_mode = "ab"
+			expected_size = self.range_total(response)
+		elif response.status_code == 200:
+			# server ignored the range so overwrite whatever we had
+			write_mode = "wb"
+
+			if "Content-Length" in response.headers and not compressed:
+				expected_size = int(response.headers["Content-Length"])
+		else:
+			print(f"Download file error: status {response.status_code} for {url}")
+			return (False, None)
+
+		with open(part_path, write_mode) as part_file:
+			for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+				part_file.write(chunk)
+
+		return (True, expected_size)
+
+	def range_start(self, response):
+		# Content-Range looks like "bytes 100-999/1000"
+		try:
+			return int(response.headers["Content-Range"].split()[1].split("-")[0])
+		except (KeyError, IndexError, ValueError):
+			return None
+
+	def range_total(self, response):
+		try:
+			return int(response.headers["Content-Range"].split("/")[1])
+		except (KeyError, IndexError, ValueError):
+			return None